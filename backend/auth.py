@@ -143,6 +143,3 @@ def initialize_default_user():
         
     except Exception as e:
         print(f"[AUTH] Error initializing default user: {e}")
-
-# Initialize default user on import
-initialize_default_user()
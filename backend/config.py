@@ -47,6 +47,12 @@ class Config:
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development").lower()
     TESTING_MODE: bool = os.getenv("TESTING_MODE", "true").lower() == "true"
     IS_PRODUCTION: bool = ENVIRONMENT == "production"
+    # Quieter by default in production; debug logging is lazy so disabled levels cost nothing
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "WARNING" if IS_PRODUCTION else "INFO").upper()
+    # Worker processes for certificate rendering (0 = one per CPU, capped at 2 to fit small instances)
+    CERT_RENDER_WORKERS: int = int(os.getenv("CERT_RENDER_WORKERS", "0")) or min(2, os.cpu_count() or 1)
+    # Rows issued concurrently by bulk generation; ~8 keeps Drive uploads under the per-user write quota
+    BULK_ISSUE_CONCURRENCY: int = max(1, int(os.getenv("BULK_ISSUE_CONCURRENCY", "8")))
     
     # ============================================
     # API URLs and Base URLs
@@ -126,6 +132,8 @@ class Config:
     SMTP_HOST: str = os.getenv("SMTP_HOST", _smtp_host_default)
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
     SMTP_USE_SSL: bool = os.getenv("SMTP_USE_SSL", "false").lower() == "true"
+    # Attach the certificate PNG to emails (the email always links to it for download)
+    EMAIL_ATTACH_CERTIFICATE: bool = os.getenv("EMAIL_ATTACH_CERTIFICATE", "false").lower() == "true"
     
     # Contact information
     CONTACT_EMAIL: str = os.getenv("CONTACT_EMAIL", _contact_email_default)
@@ -7,14 +7,22 @@ Fixes token expiry issues and eliminates repeated manual authentication
 import os
 import json
 import time
+import threading
 from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow, InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+from googleapiclient.http import MediaIoBaseUpload, build_http
+from googleapiclient.errors import HttpError
+import google_auth_httplib2
 from google.auth.transport.requests import Request
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union, BinaryIO
 import io
+from utils import escape_drive_query
+
+# Uploads above this size use a resumable session sent in chunks of RESUMABLE_CHUNK_SIZE
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+RESUMABLE_CHUNK_SIZE = 5 * 1024 * 1024
 
 class RobustGoogleDriveService:
     def __init__(self):
@@ -29,6 +37,10 @@ class RobustGoogleDriveService:
         }
         self.token_file = 'token.json'
         self.credentials_file = 'credentials.json'
+        # Per-thread HTTP clients: uploads run in worker threads and httplib2 is not thread-safe
+        self._local = threading.local()
+        # Concurrent uploads must not refresh the shared credentials at the same time
+        self._refresh_lock = threading.Lock()
         self.authenticate()
         if self.service:
             self.setup_folders()
@@ -238,25 +250,41 @@ class RobustGoogleDriveService:
         
         try:
             # Check if token is expired or will expire in the next 5 minutes
-            if self.credentials.expired or (self.credentials.expiry and 
-                self.credentials.expiry <= datetime.utcnow() + timedelta(minutes=5)):
-                
-                if self.credentials.refresh_token:
-                    print("[AUTH] Refreshing expired token...")
-                    self.credentials.refresh(Request())
-                    self._save_token(self.credentials)
-                    self.service = build('drive', 'v3', credentials=self.credentials)
-                    print("[AUTH] Token refreshed successfully")
-                    return True
-                else:
-                    print("[AUTH] Token expired and no refresh token available")
-                    return False
+            if self._token_expiring():
+                with self._refresh_lock:
+                    # Another thread may have refreshed while we waited for the lock
+                    if not self._token_expiring():
+                        return True
+                    return self._refresh_token()
         except Exception as e:
             print(f"[AUTH] Token refresh failed: {e}")
             return False
         
         return True
 
+    def _token_expiring(self) -> bool:
+        """Whether the access token is expired or expires within 5 minutes"""
+        return self.credentials.expired or bool(
+            self.credentials.expiry and self.credentials.expiry <= datetime.utcnow() + timedelta(minutes=5)
+        )
+
+    def _refresh_token(self) -> bool:
+        """Refresh the access token and rebuild the service (caller holds _refresh_lock)"""
+        if not self.credentials.refresh_token:
+            print("[AUTH] Token expired and no refresh token available")
+            return False
+        
+        try:
+            print("[AUTH] Refreshing expired token...")
+            self.credentials.refresh(Request())
+            self._save_token(self.credentials)
+            self.service = build('drive', 'v3', credentials=self.credentials)
+            print("[AUTH] Token refreshed successfully")
+            return True
+        except Exception as e:
+            print(f"[AUTH] Token refresh failed: {e}")
+            return False
+
     def setup_folders(self):
         """Verify and setup required folders in Google Drive"""
         if not self.service:
@@ -368,7 +396,7 @@ class RobustGoogleDriveService:
             self.refresh_token_if_needed()
             
             # Search for existing folder
-            query = f"name='{folder_name}' and 'root' in parents and mimeType='application/vnd.google-apps.folder'"
+            query = f"name='{escape_drive_query(folder_name)}' and 'root' in parents and mimeType='application/vnd.google-apps.folder'"
             results = self.service.files().list(
                 q=query, 
                 fields="files(id, name)"
@@ -393,8 +421,18 @@ class RobustGoogleDriveService:
             print(f"[ERROR] Error creating folder {folder_name}: {e}")
             return None
 
-    def upload_from_bytes(self, file_bytes: bytes, file_name: str, folder_type: str = "certificates", max_retries: int = 3) -> Optional[Dict[str, Any]]:
-        """Upload file from bytes to Google Drive with retry logic and timeout handling"""
+    def _thread_http(self):
+        """Authorized HTTP client owned by the calling thread"""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            base_http = build_http()
+            base_http.timeout = 120  # 2 minutes timeout
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=base_http)
+            self._local.http = http
+        return http
+
+    def upload_from_bytes(self, file_bytes: Union[bytes, BinaryIO], file_name: str, folder_type: str = "certificates", max_retries: int = 3) -> Optional[Dict[str, Any]]:
+        """Upload file from bytes (or a seekable file object, used as-is) to Google Drive with retry logic and timeout handling"""
         if not self.service:
             print("[ERROR] Google Drive service not available")
             return None
@@ -422,8 +460,12 @@ class RobustGoogleDriveService:
             print(f"[DEBUG] Available folders: {list(self.folders.keys())}")
             return None
         
+        # Stream file objects directly instead of reading them into another buffer
+        stream = file_bytes if hasattr(file_bytes, "read") else io.BytesIO(file_bytes)
+        
         print(f"[DEBUG] Uploading {file_name} to folder {actual_folder_type} (ID: {folder_id})")
-        print(f"[DEBUG] File size: {len(file_bytes)} bytes")
+        file_size = stream.seek(0, io.SEEK_END)
+        print(f"[DEBUG] File size: {file_size} bytes")
         
         for attempt in range(max_retries):
             try:
@@ -435,11 +477,14 @@ class RobustGoogleDriveService:
                     'parents': [folder_id]
                 }
                 
-                # Create media with resumable upload for large files
+                # Small files (every QR and certificate) go up in a single multipart request;
+                # a resumable session costs an extra round-trip and only pays off for large files
+                stream.seek(0)  # Rewind for each attempt
                 media = MediaIoBaseUpload(
-                    io.BytesIO(file_bytes), 
+                    stream, 
                     mimetype='image/png',
-                    resumable=True
+                    chunksize=RESUMABLE_CHUNK_SIZE,
+                    resumable=file_size > RESUMABLE_UPLOAD_THRESHOLD
                 )
                 
                 # Execute upload with timeout
@@ -447,7 +492,7 @@ class RobustGoogleDriveService:
                     body=file_metadata,
                     media_body=media,
                     fields='id, webViewLink, webContentLink'
-                ).execute()
+                ).execute(http=self._thread_http())
                 
                 print(f"[DEBUG] Upload successful on attempt {attempt + 1}")
                 
@@ -456,7 +501,7 @@ class RobustGoogleDriveService:
                     self.service.permissions().create(
                         fileId=file.get('id'),
                         body={'role': 'reader', 'type': 'anyone'}
-                    ).execute()
+                    ).execute(http=self._thread_http())
                     print(f"[DEBUG] File permissions set successfully")
                 except Exception as perm_error:
                     print(f"[WARNING] Could not set file permissions: {perm_error}")
@@ -479,9 +524,14 @@ class RobustGoogleDriveService:
             except Exception as e:
                 print(f"[ERROR] Upload attempt {attempt + 1} failed: {e}")
                 if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2  # Exponential backoff: 2, 4, 6 seconds
+                    wait_time = 2 ** (attempt + 1)  # Exponential backoff: 2, 4, 8 seconds
+                    if isinstance(e, HttpError) and e.resp.status == 429:
+                        # Rate limited - wait at least as long as Drive asks
+                        try:
+                            wait_time = max(wait_time, int(e.resp.get('retry-after', 0)))
+                        except ValueError:
+                            pass
                     print(f"[DEBUG] Waiting {wait_time} seconds before retry...")
-                    import time
                     time.sleep(wait_time)
                 else:
                     print(f"[ERROR] All {max_retries} upload attempts failed for {file_name}")
@@ -507,7 +557,7 @@ class RobustGoogleDriveService:
                 return []
             
             # Search for files with the exact name in the specified folder
-            query = f"name='{file_name}' and parents in '{folder_id}' and trashed=false"
+            query = f"name='{escape_drive_query(file_name)}' and parents in '{folder_id}' and trashed=false"
             results = self.service.files().list(
                 q=query,
                 fields="files(id,name,mimeType,createdTime,modifiedTime)"
@@ -564,3 +614,35 @@ class RobustGoogleDriveService:
             status["refresh_token_available"] = bool(self.credentials.refresh_token)
         
         return status
+
+
+_drive_service: Optional[RobustGoogleDriveService] = None
+_drive_service_initialised = False
+_drive_service_lock = threading.Lock()
+
+def get_drive_service() -> Optional[RobustGoogleDriveService]:
+    """Shared Google Drive service, authenticated once per process (None if unavailable)"""
+    global _drive_service, _drive_service_initialised
+    if _drive_service_initialised:
+        return _drive_service
+    
+    with _drive_service_lock:
+        if _drive_service_initialised:
+            return _drive_service
+        
+        # Make authentication non-blocking to allow server to start
+        try:
+            drive_service = RobustGoogleDriveService()
+            if drive_service.is_authenticated():
+                print("[SUCCESS] Google Drive service authenticated successfully")
+            else:
+                print("[WARNING] Google Drive service not authenticated!")
+                print("[WARNING] Please check your GOOGLE_OAUTH_TOKEN environment variable")
+                drive_service = None
+        except Exception as e:
+            print(f"[WARNING] Google Drive service initialization failed: {e}")
+            drive_service = None
+        
+        _drive_service = drive_service
+        _drive_service_initialised = True
+        return _drive_service
@@ -1,844 +1,356 @@
 from pymongo import MongoClient
-from typing import List, Optional, Dict, Any
+from pymongo.errors import BulkWriteError, PyMongoError
+from typing import List, Optional, Dict, Any, Tuple
 import smtplib
 import ssl
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+from email.mime.image import MIMEImage
 import asyncio
 import os
+import re
+import threading
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import secrets
 import string
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image, ImageDraw, ImageFont
 import qrcode
 from io import BytesIO
+import logging
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from cachetools import TTLCache
 
 from models import Template, Certificate, Placeholder
 from utils import generate_certificate_id
-from robust_google_drive_service import RobustGoogleDriveService
+from robust_google_drive_service import get_drive_service
 from config import config
 
-class TemplateService:
-    def __init__(self, db):
-        self.db = db
-        self.templates = db.templates
-        # Use robust service for all environments - no fallback
-        # Make authentication non-blocking to allow server to start
-        try:
-            self.drive_service = RobustGoogleDriveService()
-            if not self.drive_service.is_authenticated():
-                print("[WARNING] Google Drive service not authenticated!")
-                print("[WARNING] Please check your GOOGLE_OAUTH_TOKEN environment variable")
-                print("[WARNING] Template uploads will fail, but listing templates will work")
-                self.drive_service = None
-            else:
-                print("[SUCCESS] Google Drive service authenticated successfully")
-        except Exception as e:
-            print(f"[WARNING] Google Drive service initialization failed: {e}")
-            print("[WARNING] Template uploads will fail, but listing templates will work")
-            self.drive_service = None
+logger = logging.getLogger(__name__)
 
-    async def upload_template(self, file, template_name: str, description: str = "") -> str:
-        """Upload a template image and save metadata"""
-        # Check if Google Drive service is available
-        if not self.drive_service:
-            raise ValueError("Google Drive service is not available. Please check your GOOGLE_OAUTH_TOKEN environment variable.")
-        
-        # Generate template ID
-        template_id = f"TPL-{datetime.now().strftime('%Y%m%d')}-{secrets.token_hex(3).upper()}"
-        
-        # Validate file extension
-        file_extension = file.filename.split('.')[-1].lower()
-        if file_extension not in ['png', 'jpg', 'jpeg']:
-            raise ValueError("Only PNG, JPG, and JPEG files are allowed")
-        
-        # Read file content
-        content = await file.read()
-        
-        # Upload to Google Drive
-        file_name = f"{template_id}.{file_extension}"
-        drive_result = self.drive_service.upload_from_bytes(
-            content, file_name, "templates"
-        )
-        
-        if not drive_result:
-            raise ValueError("Failed to upload template to Google Drive. Please check your Google Drive credentials.")
-        
-        # Save to database with Google Drive URL
-        template_data = {
-            "template_id": template_id,
-            "name": template_name,
-            "description": description,
-            "image_path": drive_result['image_url'],  # Direct image URL for frontend display
-            "drive_file_id": drive_result['id'],  # Store Drive file ID for future operations
-            "placeholders": [],
-            "uploaded_at": datetime.now()
-        }
-        
-        self.templates.insert_one(template_data)
-        return template_id
+# Template documents change rarely; keep recently used ones in-process so certificate
+# generation skips the MongoDB round-trip. Writers must call invalidate_template_cache().
+_template_cache = TTLCache(maxsize=512, ttl=60)
 
-    async def set_placeholders(self, template_id: str, placeholders: List[Placeholder]):
-        """Set placeholder positions for a template"""
-        result = self.templates.update_one(
-            {"template_id": template_id},
-            {"$set": {"placeholders": [p.dict() for p in placeholders]}}
-        )
-        
-        if result.matched_count == 0:
-            raise ValueError("Template not found")
+def invalidate_template_cache(template_id: Optional[str] = None):
+    """Drop one cached template (or all of them when no ID is given)"""
+    if template_id is None:
+        _template_cache.clear()
+    else:
+        _template_cache.pop(template_id, None)
 
-    async def get_template(self, template_id: str) -> Optional[Dict]:
-        """Get template by ID"""
-        return self.templates.find_one({"template_id": template_id}, {"_id": 0})
+QR_BORDER = 4
 
-    async def list_templates(self) -> List[Dict]:
-        """List all templates"""
-        try:
-            # Count templates first for debugging
-            count = self.templates.count_documents({})
-            print(f"[TEMPLATE SERVICE] Found {count} templates in database")
-            
-            # Fetch all templates
-            templates = list(self.templates.find({}, {"_id": 0}))
-            print(f"[TEMPLATE SERVICE] Returning {len(templates)} templates")
-            
-            # Log template IDs for debugging
-            if templates:
-                template_ids = [t.get("template_id", "NO_ID") for t in templates]
-                print(f"[TEMPLATE SERVICE] Template IDs: {template_ids}")
-            else:
-                print("[TEMPLATE SERVICE] WARNING: No templates found in database")
-            
-            return templates
-        except Exception as e:
-            print(f"[TEMPLATE SERVICE] ERROR listing templates: {e}")
-            import traceback
-            traceback.print_exc()
-            raise
+# MongoDB's maxWriteBatchSize is 100k, but smaller batches keep each round-trip bounded
+BULK_WRITE_BATCH_SIZE = 1000
 
-class CertificateService:
-    def __init__(self, db):
-        self.db = db
-        self.student_details = db.student_details
-        self.templates = db.templates
-        # Use robust service for all environments - no fallback
-        # Make authentication non-blocking to allow server to start
-        try:
-            self.drive_service = RobustGoogleDriveService()
-            if not self.drive_service.is_authenticated():
-                print("[WARNING] Google Drive service not authenticated!")
-                print("[WARNING] Please check your GOOGLE_OAUTH_TOKEN environment variable")
-                print("[WARNING] Certificate generation will fail, but other operations will work")
-                self.drive_service = None
-            else:
-                print("[SUCCESS] Google Drive service authenticated successfully for CertificateService")
-        except Exception as e:
-            print(f"[WARNING] Google Drive service initialization failed for CertificateService: {e}")
-            print("[WARNING] Certificate generation will fail, but other operations will work")
-            self.drive_service = None
+# Fields returned by template listings, and a cap on how many are returned
+TEMPLATE_LIST_PROJECTION = {"_id": 0, "template_id": 1, "name": 1, "description": 1, "image_path": 1, "drive_file_id": 1, "uploaded_at": 1}
+TEMPLATE_LIST_LIMIT = 1000
 
-    def _calculate_text_position(self, draw, text, font, x1, y1, x2, y2, text_align, vertical_align, device_type="desktop"):
-        """Calculate text position within a rectangle based on alignment settings with device-specific padding"""
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except:
-            # Fallback if textbbox fails
-            text_width = len(text) * 10  # Rough estimate
-            text_height = 20
-        
-        # Calculate rectangle dimensions
-        rect_width = x2 - x1
-        rect_height = y2 - y1
-        
-        # Device-specific padding for 2000×1414 canvas
-        if device_type == "mobile":
-            # Adaptive mobile padding that scales better with rectangle size
-            # Use smaller minimum padding and cap maximum padding percentage
-            padding_x = max(6, min(rect_width * 0.08, rect_width * 0.12))
-            padding_y = max(4, min(rect_height * 0.08, rect_height * 0.15))
-        elif device_type == "desktop":
-            padding_x = max(5, rect_width * 0.05)  # Standard padding for desktop
-            padding_y = max(5, rect_height * 0.05)
-        else:
-            padding_x = max(6, rect_width * 0.06)  # Balanced padding for unknown devices
-            padding_y = max(4, rect_height * 0.08)
-        
-        print(f"Debug: Text positioning - Text: '{text}', Rectangle: ({x1}, {y1}) to ({x2}, {y2})")
-        print(f"Debug: Text positioning - Text size: {text_width}x{text_height}, Rectangle size: {rect_width}x{rect_height}")
-        print(f"Debug: Text positioning - Padding: X={padding_x:.1f}, Y={padding_y:.1f}")
-        
-        # Horizontal alignment with proper padding
-        if text_align == "left":
-            text_x = x1 + padding_x
-        elif text_align == "right":
-            text_x = x2 - text_width - padding_x
-        else:  # center
-            text_x = x1 + (rect_width - text_width) // 2
-        
-        # Vertical alignment with proper padding
-        if vertical_align == "top":
-            text_y = y1 + padding_y
-        elif vertical_align == "bottom":
-            text_y = y2 - text_height - padding_y
-        else:  # center
-            text_y = y1 + (rect_height - text_height) // 2
-        
-        # Ensure text stays within rectangle bounds with better constraint handling
-        text_x = max(x1 + padding_x, min(text_x, x2 - text_width - padding_x))
-        text_y = max(y1 + padding_y, min(text_y, y2 - text_height - padding_y))
-        
-        # Additional alignment refinement for better positioning
-        if text_align == "center":
-            # Ensure center alignment is truly centered
-            text_x = x1 + (rect_width - text_width) // 2
-        elif text_align == "right":
-            # Ensure right alignment is properly positioned
-            text_x = x2 - text_width - padding_x
-        elif text_align == "left":
-            # Ensure left alignment is properly positioned
-            text_x = x1 + padding_x
-        
-        if vertical_align == "center":
-            # Ensure center alignment is truly centered vertically
-            text_y = y1 + (rect_height - text_height) // 2
-        elif vertical_align == "bottom":
-            # Ensure bottom alignment is properly positioned
-            text_y = y2 - text_height - padding_y
-        elif vertical_align == "top":
-            # Ensure top alignment is properly positioned
-            text_y = y1 + padding_y
-        
-        # Final position validation and adjustment
-        # Ensure text is properly positioned within rectangle bounds
-        text_x = max(x1 + padding_x, min(text_x, x2 - text_width - padding_x))
-        text_y = max(y1 + padding_y, min(text_y, y2 - text_height - padding_y))
-        
-        print(f"Debug: Final text position - X: {text_x}, Y: {text_y}")
-        return text_x, text_y
+# Fire-and-forget tasks (certificate emails) must stay referenced until they finish
+_background_tasks = set()
 
+# Shared HTTP session so template downloads reuse pooled keep-alive connections; transient
+# Drive errors (429/5xx, dropped connections) are retried with backoff inside the adapter
+_http_retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+_http_session = requests.Session()
+_http_session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=_http_retry))
+_http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=_http_retry))
 
-    async def generate_certificate(self, template_id: str, student_name: str, course_name: str, date_str: str, device_type: str = "desktop", extra_fields: Optional[Dict[str, Any]] = None, student_email: Optional[str] = None) -> Dict:
-        """Generate a certificate with text overlay and QR code"""
-        # Check if Google Drive service is available
-        if not self.drive_service:
-            raise ValueError("Google Drive service is not available. Please check your GOOGLE_OAUTH_TOKEN environment variable.")
-        
-        # Get template
-        template = self.templates.find_one({"template_id": template_id})
-        if not template:
-            raise ValueError("Template not found")
-        
-        # Generate certificate ID
-        certificate_id = generate_certificate_id()
-        
-        # Load template image (handle both local and Google Drive URLs)
-        template_path = template["image_path"]
-        
-        try:
-            if template_path.startswith(('http://', 'https://')):
-                # Google Drive URL - use direct image URL
-                import requests
-                response = requests.get(template_path, timeout=30)
-                response.raise_for_status()  # Raise exception for HTTP errors
-                template_image = Image.open(BytesIO(response.content))
-            else:
-                # Local file path
-                template_image = Image.open(template_path)
-        except requests.exceptions.RequestException as e:
-            raise ValueError(f"Template image not accessible from Google Drive: {str(e)}. The template may have been deleted from Google Drive.")
-        except Exception as e:
-            raise ValueError(f"Failed to load template image: {str(e)}")
-        
-        draw = ImageDraw.Draw(template_image)
-        
-        # Load font (fallback to system fonts if not found)
+def _fetch_template_bytes(template_path: str) -> bytes:
+    """Raw template image bytes from a Google Drive URL or local path"""
+    if template_path.startswith(('http://', 'https://')):
+        # Google Drive URL - use direct image URL
+        response = _http_session.get(template_path, timeout=30)
+        response.raise_for_status()  # Raise exception for HTTP errors
+        return response.content
+    # Local file path
+    with open(template_path, "rb") as f:
+        return f.read()
+
+@lru_cache(maxsize=32)
+def _qr_version(payload_length: int) -> int:
+    """Smallest QR version that fits a byte-mode payload of the given length"""
+    probe = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=QR_BORDER)
+    probe.add_data("x" * payload_length)
+    return probe.best_fit()
+
+def build_qr_image(data: str, size: int = 150) -> Image.Image:
+    """Render a QR code directly at the target size (no post-hoc resize)"""
+    # Verification URLs share a prefix and a fixed-length certificate ID, so the
+    # version is resolved once per payload length instead of via make(fit=True)
+    version = _qr_version(len(data.encode("utf-8")))
+    modules = 17 + 4 * version + 2 * QR_BORDER
+    box_size = max(1, size // modules)
+    qr = qrcode.QRCode(
+        version=version,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        border=QR_BORDER
+    )
+    qr.add_data(data)
+    qr.make(fit=False)
+    
+    # Rasterise the module matrix in one pass and scale it up in C, instead of
+    # make_image() drawing a rectangle per module from Python
+    matrix = qr.get_matrix()
+    qr_image = Image.frombytes("L", (modules, modules), bytes(0 if cell else 255 for row in matrix for cell in row))
+    qr_image = qr_image.resize((modules * box_size, modules * box_size), Image.NEAREST)
+    qr_image = qr_image.convert("1", dither=Image.Dither.NONE)
+    
+    if qr_image.width > size:
+        # Target is smaller than one pixel per module - nearest-neighbour keeps the whole
+        # code in frame (cropping it would make it unscannable)
+        qr_image = qr_image.resize((size, size), Image.NEAREST)
+    elif qr_image.size != (size, size):
+        # Pad with quiet zone up to the exact placeholder size, keeping modules crisp
+        canvas = Image.new(qr_image.mode, (size, size), 1)
+        offset = (size - qr_image.width) // 2
+        canvas.paste(qr_image, (offset, offset))
+        qr_image = canvas
+    return qr_image
+
+# Candidate fonts for certificate text, first one present on disk wins
+FONT_PATHS = [
+    "fonts/radley.ttf",  # Radley font (primary for certificate inputs)
+    "fonts/arial.ttf",  # Deployment font (fallback)
+    "C:/Windows/Fonts/arial.ttf",  # Windows Arial
+    "C:/Windows/Fonts/calibri.ttf",  # Windows Calibri
+    "C:/Windows/Fonts/tahoma.ttf",  # Windows Tahoma
+    "/System/Library/Fonts/Arial.ttf",  # macOS Arial
+    "/System/Library/Fonts/Helvetica.ttc",  # macOS Helvetica
+    "/usr/share/fonts/truetype/arial.ttf",  # Linux Arial
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux DejaVu
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",  # Linux Liberation
+]
+
+# Probed once at import so requests never pay for failed opens
+_FONT_PATH = next((p for p in FONT_PATHS if os.path.exists(p)), None)
+
+@lru_cache(maxsize=256)
+def get_font(size: int):
+    """Font at the given size, parsed once per size and reused across certificates"""
+    if _FONT_PATH:
         try:
-            # Try to load PlayfairDisplay font first
-            font_large = ImageFont.truetype("storage/fonts/PlayfairDisplay-Bold.ttf", 48)
-            font_small = ImageFont.truetype("storage/fonts/PlayfairDisplay-Bold.ttf", 18)
-        except:
-            try:
-                # Try system fonts as fallback
-                font_large = ImageFont.truetype("arial.ttf", 48)
-                font_small = ImageFont.truetype("arial.ttf", 18)
-            except:
-                try:
-                    # Try other common system fonts
-                    font_large = ImageFont.truetype("calibri.ttf", 48)
-                    font_small = ImageFont.truetype("calibri.ttf", 18)
-                except:
-                    # Final fallback to default
-                    font_large = ImageFont.load_default()
-                    font_small = ImageFont.load_default()
-        
-        # Get image dimensions for positioning
-        img_width, img_height = template_image.size
-        print(f"Debug: Image dimensions: {img_width}x{img_height}")
-        
-        # Define text colors
-        text_color = "#0b2a4a"  # Dark blue color
-        
-        # Use template placeholders for positioning if available
-        placeholders = template.get("placeholders", [])
-        
-        # Fixed resolution system: Always work with 2000×1414 pixel canvas
-        # No scaling - use raw pixel coordinates as specified
-        fixed_canvas_width = 2000
-        fixed_canvas_height = 1414
-        
-        print(f"Debug: Working with fixed canvas size: {fixed_canvas_width}x{fixed_canvas_height}")
-        print(f"Debug: Template image size: {img_width}x{img_height}")
-        print(f"Debug: Device type: {device_type}")
-        print(f"Debug: Using raw pixel coordinates with device-specific adjustments")
-        
-        # Device-specific adjustments for fixed resolution system
-        device_multiplier = 1.0
-        if device_type == "mobile":
-            device_multiplier = 1.2  # Larger fonts/padding for mobile readability
-            print("Debug: Mobile device detected - applying mobile-friendly adjustments")
-        elif device_type == "desktop":
-            device_multiplier = 1.0  # Standard sizing for desktop
-            print("Debug: Desktop device detected - using standard sizing")
-        else:
-            device_multiplier = 1.05  # Balanced approach for unknown devices
-            print("Debug: Unknown device type - using balanced adjustments")
-        
-        # Find placeholders for each field
-        name_placeholder = next((p for p in placeholders if p["key"] == "student_name"), None)
-        date_placeholder = next((p for p in placeholders if p["key"] == "date"), None)
-        cert_no_placeholder = next((p for p in placeholders if p["key"] == "certificate_no"), None)
-        qr_placeholder = next((p for p in placeholders if p["key"] == "qr_code"), None)
-        
-        print(f"DEBUG: Found placeholders - Name: {name_placeholder is not None}, Date: {date_placeholder is not None}, Cert No: {cert_no_placeholder is not None}, QR: {qr_placeholder is not None}")
-        
-        if name_placeholder:
-            print(f"DEBUG: Name placeholder - x1: {name_placeholder.get('x1')}, y1: {name_placeholder.get('y1')}, x2: {name_placeholder.get('x2')}, y2: {name_placeholder.get('y2')}, font_size: {name_placeholder.get('font_size')}, color: {name_placeholder.get('color')}")
-        if date_placeholder:
-            print(f"DEBUG: Date placeholder - x1: {date_placeholder.get('x1')}, y1: {date_placeholder.get('y1')}, x2: {date_placeholder.get('x2')}, y2: {date_placeholder.get('y2')}, font_size: {date_placeholder.get('font_size')}, color: {date_placeholder.get('color')}")
-        if cert_no_placeholder:
-            print(f"DEBUG: Cert No placeholder - x1: {cert_no_placeholder.get('x1')}, y1: {cert_no_placeholder.get('y1')}, x2: {cert_no_placeholder.get('x2')}, y2: {cert_no_placeholder.get('y2')}, font_size: {cert_no_placeholder.get('font_size')}, color: {cert_no_placeholder.get('color')}")
-        if qr_placeholder:
-            print(f"DEBUG: QR placeholder - x1: {qr_placeholder.get('x1')}, y1: {qr_placeholder.get('y1')}, x2: {qr_placeholder.get('x2')}, y2: {qr_placeholder.get('y2')}")
-        
-        # Initialize position variables
-        name_x, name_y = 0, 0
-        date_x, date_y = 0, 0
-        cert_no_x, cert_no_y = 0, 0
-        
-        # Position 1: Student Name
-        # Parse color properly first (needed for both if and else blocks)
-        name_color = text_color  # Default color
-        if name_placeholder and name_placeholder.get("x1") is not None:
-            # Use raw pixel coordinates without scaling (fixed 2000×1414 canvas)
-            name_x1 = int(name_placeholder["x1"])
-            name_y1 = int(name_placeholder["y1"])
-            name_x2 = int(name_placeholder["x2"])
-            name_y2 = int(name_placeholder["y2"])
-            
-            # Parse color from placeholder
-            raw_color = name_placeholder.get("color", text_color)
-            if raw_color and raw_color.startswith("#"):
-                name_color = raw_color
-            
-            # Use font size with device-specific adjustments
-            base_font_size = name_placeholder.get("font_size", 48)
-            name_font_size = int(base_font_size * device_multiplier)
-            print(f"Debug: Name coordinates - Raw: ({name_x1}, {name_y1}) to ({name_x2}, {name_y2})")
-            print(f"Debug: Name font size: {name_font_size}, Color: {name_color}")
-            name_align = name_placeholder.get("text_align", "center")
-            name_v_align = name_placeholder.get("vertical_align", "center")
-            
-            # Load appropriate font size with better fallback
-            name_font = None
-            
-            # Try multiple font paths with proper error handling
-            # Use Radley font first for certificate inputs, then fallbacks
-            font_paths = [
-                "fonts/radley.ttf",  # Radley font (primary for certificate inputs)
-                "fonts/arial.ttf",  # Deployment font (fallback)
-                "arial.ttf",  # System Arial
-                "Arial.ttf",  # System Arial (capital)
-                "C:/Windows/Fonts/arial.ttf",  # Windows Arial
-                "C:/Windows/Fonts/calibri.ttf",  # Windows Calibri
-                "C:/Windows/Fonts/tahoma.ttf",  # Windows Tahoma
-                "/System/Library/Fonts/Arial.ttf",  # macOS Arial
-                "/System/Library/Fonts/Helvetica.ttc",  # macOS Helvetica
-                "/usr/share/fonts/truetype/arial.ttf",  # Linux Arial
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux DejaVu
-                "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",  # Linux Liberation
-            ]
-            
-            for font_path in font_paths:
-                try:
-                    name_font = ImageFont.truetype(font_path, name_font_size)
-                    print(f"Debug: Successfully loaded font: {font_path} at size {name_font_size}")
-                    break
-                except Exception as e:
-                    print(f"Debug: Failed to load {font_path}: {e}")
-                    continue
-            
-            if name_font is None:
-                # Last resort: use default font with size tracking
-                try:
-                    name_font = ImageFont.load_default()
-                    print(f"Debug: Using default font (requested size: {name_font_size})")
-                    # Store the requested size for reference
-                    name_font.requested_size = name_font_size
-                except Exception as e:
-                    print(f"Debug: Complete font loading failure: {e}")
-                    name_font = ImageFont.load_default()
-                    name_font.requested_size = name_font_size
-            
-            # Calculate text position based on alignment (fixed resolution with device adjustments)
-            name_x, name_y = self._calculate_text_position(
-                draw, student_name, name_font, name_x1, name_y1, name_x2, name_y2, name_align, name_v_align, device_type
-            )
-            
-            # Draw student name with stroke
-            for adj in range(-2, 3):
-                for adj2 in range(-2, 3):
-                    draw.text((name_x + adj, name_y + adj2), student_name, font=name_font, fill="white")
-            draw.text((name_x, name_y), student_name, font=name_font, fill=name_color)
-        else:
-            # Fallback to default positioning
-            name_center_x = img_width // 2
-            name_center_y = img_height // 2 - 50
-            try:
-                bbox = draw.textbbox((0, 0), student_name, font=font_large)
-                name_text_width = bbox[2] - bbox[0]
-                name_text_height = bbox[3] - bbox[1]
-                name_x = name_center_x - (name_text_width // 2)
-                name_y = name_center_y - (name_text_height // 2)
-            except:
-                name_x = name_center_x - 100
-                name_y = name_center_y - 20
-            
-            # Draw student name with stroke
-            for adj in range(-2, 3):
-                for adj2 in range(-2, 3):
-                    draw.text((name_x + adj, name_y + adj2), student_name, font=font_large, fill="white")
-            draw.text((name_x, name_y), student_name, font=font_large, fill=text_color)
-        
-        # Position 2: Date
-        # Parse color properly first (needed for both if and else blocks)
-        date_color = text_color  # Default color
-        if date_placeholder and date_placeholder.get("x1") is not None:
-            # Use raw pixel coordinates without scaling (fixed 2000×1414 canvas)
-            date_x1 = int(date_placeholder["x1"])
-            date_y1 = int(date_placeholder["y1"])
-            date_x2 = int(date_placeholder["x2"])
-            date_y2 = int(date_placeholder["y2"])
-            
-            # Parse color from placeholder
-            raw_date_color = date_placeholder.get("color", text_color)
-            if raw_date_color and raw_date_color.startswith("#"):
-                date_color = raw_date_color
-            
-            # Use font size with device-specific adjustments
-            base_date_font_size = date_placeholder.get("font_size", 18)
-            date_font_size = int(base_date_font_size * device_multiplier)
-            print(f"Debug: Date coordinates - Raw: ({date_x1}, {date_y1}) to ({date_x2}, {date_y2})")
-            date_align = date_placeholder.get("text_align", "left")
-            date_v_align = date_placeholder.get("vertical_align", "center")
-            
-            print(f"DEBUG: Using rectangle coordinates for date: ({date_x1}, {date_y1}) to ({date_x2}, {date_y2})")
-            
-            # Load appropriate font size with better fallback
-            date_font = None
-            
-            # Try multiple font paths with proper error handling
-            # Use Radley font first for certificate inputs, then fallbacks
-            font_paths = [
-                "fonts/radley.ttf",  # Radley font (primary for certificate inputs)
-                "fonts/arial.ttf",  # Deployment font (fallback)
-                "arial.ttf",  # System Arial
-                "Arial.ttf",  # System Arial (capital)
-                "C:/Windows/Fonts/arial.ttf",  # Windows Arial
-                "C:/Windows/Fonts/calibri.ttf",  # Windows Calibri
-                "C:/Windows/Fonts/tahoma.ttf",  # Windows Tahoma
-                "/System/Library/Fonts/Arial.ttf",  # macOS Arial
-                "/System/Library/Fonts/Helvetica.ttc",  # macOS Helvetica
-                "/usr/share/fonts/truetype/arial.ttf",  # Linux Arial
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux DejaVu
-                "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",  # Linux Liberation
-            ]
-            
-            print(f"Debug: Attempting to load date font with size {date_font_size}")
-            
-            for font_path in font_paths:
-                try:
-                    date_font = ImageFont.truetype(font_path, date_font_size)
-                    print(f"Debug: Successfully loaded date font: {font_path} at size {date_font_size}")
-                    break
-                except Exception as e:
-                    print(f"Debug: Failed to load date font {font_path}: {e}")
-                    continue
-            
-            if date_font is None:
-                # Last resort: use default font with size tracking
-                try:
-                    date_font = ImageFont.load_default()
-                    print(f"Debug: Using default date font (requested size: {date_font_size})")
-                    date_font.requested_size = date_font_size
-                except Exception as e:
-                    print(f"Debug: Complete date font loading failure: {e}")
-                    date_font = ImageFont.load_default()
-                    date_font.requested_size = date_font_size
-            
-            # Calculate text position based on alignment (fixed resolution with device adjustments)
-            date_x, date_y = self._calculate_text_position(
-                draw, date_str, date_font, date_x1, date_y1, date_x2, date_y2, date_align, date_v_align, device_type
-            )
-            
-            print(f"DEBUG: Calculated date position: ({date_x}, {date_y})")
-            print(f"DEBUG: Date alignment: {date_align}, vertical: {date_v_align}")
-            print(f"DEBUG: Date text: '{date_str}', font size: {date_font_size}, color: {date_color}")
-            
-            # Draw date with stroke (template already has "Date:" label)
-            for adj in range(-1, 2):
-                for adj2 in range(-1, 2):
-                    draw.text((date_x + adj, date_y + adj2), date_str, font=date_font, fill="white")
-            draw.text((date_x, date_y), date_str, font=date_font, fill=date_color)
-        else:
-            # Fallback to default positioning
-            date_x = 50
-            date_y = img_height - 100
-            
-            try:
-                bbox = draw.textbbox((0, 0), date_str, font=font_small)
-                date_text_height = bbox[3] - bbox[1]
-                date_y = date_y - (date_text_height // 2)
-            except:
-                date_y = date_y - 10
-            
-            # Draw date with stroke
-            for adj in range(-1, 2):
-                for adj2 in range(-1, 2):
-                    draw.text((date_x + adj, date_y + adj2), date_str, font=font_small, fill="white")
-            draw.text((date_x, date_y), date_str, font=font_small, fill=text_color)
-        
-        # Position 3: Certificate Number
-        # Parse color properly first (needed for both if and else blocks)
-        cert_no_color = text_color  # Default color
-        if cert_no_placeholder and cert_no_placeholder.get("x1") is not None:
-            # Use raw pixel coordinates without scaling (fixed 2000×1414 canvas)
-            cert_no_x1 = int(cert_no_placeholder["x1"])
-            cert_no_y1 = int(cert_no_placeholder["y1"])
-            cert_no_x2 = int(cert_no_placeholder["x2"])
-            cert_no_y2 = int(cert_no_placeholder["y2"])
-            
-            # Parse color from placeholder
-            raw_cert_no_color = cert_no_placeholder.get("color", text_color)
-            if raw_cert_no_color and raw_cert_no_color.startswith("#"):
-                cert_no_color = raw_cert_no_color
-            
-            # Use font size with device-specific adjustments
-            base_cert_no_font_size = cert_no_placeholder.get("font_size", 16)
-            cert_no_font_size = int(base_cert_no_font_size * device_multiplier)
-            print(f"Debug: Cert No coordinates - Raw: ({cert_no_x1}, {cert_no_y1}) to ({cert_no_x2}, {cert_no_y2})")
-            cert_no_align = cert_no_placeholder.get("text_align", "left")
-            cert_no_v_align = cert_no_placeholder.get("vertical_align", "center")
-            
-            print(f"DEBUG: Using rectangle coordinates for cert_no: ({cert_no_x1}, {cert_no_y1}) to ({cert_no_x2}, {cert_no_y2})")
-            
-            # Load appropriate font size with better fallback
-            cert_no_font = None
-            
-            # Try multiple font paths with proper error handling
-            # Use Radley font first for certificate inputs, then fallbacks
-            font_paths = [
-                "fonts/radley.ttf",  # Radley font (primary for certificate inputs)
-                "fonts/arial.ttf",  # Deployment font (fallback)
-                "arial.ttf",  # System Arial
-                "Arial.ttf",  # System Arial (capital)
-                "C:/Windows/Fonts/arial.ttf",  # Windows Arial
-                "C:/Windows/Fonts/calibri.ttf",  # Windows Calibri
-                "C:/Windows/Fonts/tahoma.ttf",  # Windows Tahoma
-                "/System/Library/Fonts/Arial.ttf",  # macOS Arial
-                "/System/Library/Fonts/Helvetica.ttc",  # macOS Helvetica
-                "/usr/share/fonts/truetype/arial.ttf",  # Linux Arial
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux DejaVu
-                "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",  # Linux Liberation
-            ]
-            
-            for font_path in font_paths:
-                try:
-                    cert_no_font = ImageFont.truetype(font_path, cert_no_font_size)
-                    print(f"Debug: Successfully loaded cert_no font: {font_path} at size {cert_no_font_size}")
-                    break
-                except Exception as e:
-                    print(f"Debug: Failed to load cert_no font {font_path}: {e}")
-                    continue
-            
-            if cert_no_font is None:
-                # Last resort: use default font with size tracking
-                try:
-                    cert_no_font = ImageFont.load_default()
-                    print(f"Debug: Using default cert_no font (requested size: {cert_no_font_size})")
-                    cert_no_font.requested_size = cert_no_font_size
-                except Exception as e:
-                    print(f"Debug: Complete cert_no font loading failure: {e}")
-                    cert_no_font = ImageFont.load_default()
-                    cert_no_font.requested_size = cert_no_font_size
-            
-            # Calculate text position based on alignment (fixed resolution with device adjustments)
-            cert_no_x, cert_no_y = self._calculate_text_position(
-                draw, certificate_id, cert_no_font, cert_no_x1, cert_no_y1, cert_no_x2, cert_no_y2, cert_no_align, cert_no_v_align, device_type
-            )
-            
-            print(f"DEBUG: Calculated cert_no position: ({cert_no_x}, {cert_no_y})")
-            print(f"DEBUG: Cert no text: '{certificate_id}', font size: {cert_no_font_size}, color: {cert_no_color}")
-            print(f"DEBUG: Cert no alignment: {cert_no_align}, vertical: {cert_no_v_align}")
-            
-            # Draw certificate number with stroke (template already has "Certificate No:" label)
-            for adj in range(-1, 2):
-                for adj2 in range(-1, 2):
-                    draw.text((cert_no_x + adj, cert_no_y + adj2), certificate_id, font=cert_no_font, fill="white")
-            draw.text((cert_no_x, cert_no_y), certificate_id, font=cert_no_font, fill=cert_no_color)
-            print(f"DEBUG: Certificate number drawn at ({cert_no_x}, {cert_no_y})")
-        else:
-            # Fallback to default positioning for certificate number
-            cert_no_x = img_width - 200  # Right side of image
-            cert_no_y = img_height - 50  # Bottom of image
-            
-            try:
-                bbox = draw.textbbox((0, 0), certificate_id, font=font_small)
-                cert_no_text_width = bbox[2] - bbox[0]
-                cert_no_text_height = bbox[3] - bbox[1]
-                cert_no_x = cert_no_x - cert_no_text_width  # Align to right
-                cert_no_y = cert_no_y - (cert_no_text_height // 2)
-            except:
-                cert_no_x = cert_no_x - 100
-                cert_no_y = cert_no_y - 10
-            
-            # Draw certificate number with stroke
-            for adj in range(-1, 2):
-                for adj2 in range(-1, 2):
-                    draw.text((cert_no_x + adj, cert_no_y + adj2), certificate_id, font=font_small, fill="white")
-            draw.text((cert_no_x, cert_no_y), certificate_id, font=font_small, fill=text_color)
-        
-        print(f"Debug: Text positions - Name: ({name_x}, {name_y}), Date: ({date_x}, {date_y}), Cert No: ({cert_no_x}, {cert_no_y})")
-        
-        # Generate QR code
-        # Get the base URL from config
-        verification_url = config.get_verify_url(certificate_id)
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(verification_url)
-        qr.make(fit=True)
-        
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        
-        # Resize QR code
-        qr_size = 150
-        qr_image = qr_image.resize((qr_size, qr_size))
-        
-        # Paste QR code on certificate
-        if qr_placeholder and qr_placeholder.get("x1") is not None:
-            # Use raw pixel coordinates without scaling (fixed 2000×1414 canvas)
-            qr_x = int(qr_placeholder["x1"])
-            qr_y = int(qr_placeholder["y1"])
-            print(f"Debug: QR code positioned at placeholder ({qr_x}, {qr_y})")
-        else:
-            # Default position (bottom-right)
-            qr_x = template_image.width - qr_size - 50
-            qr_y = template_image.height - qr_size - 50
-            print(f"Debug: QR code positioned at default ({qr_x}, {qr_y})")
-        
-        template_image.paste(qr_image, (qr_x, qr_y))
-        
-        # Save certificate to Google Drive
-        certificate_buffer = BytesIO()
-        template_image.save(certificate_buffer, format='PNG')
-        certificate_buffer.seek(0)
-        
-        certificate_drive_result = self.drive_service.upload_from_bytes(
-            certificate_buffer.getvalue(), f"{certificate_id}.png", "certificates", max_retries=3
-        )
-        
-        if not certificate_drive_result:
-            print(f"[ERROR] Failed to upload certificate to Google Drive after retries")
-            # Try to save locally as fallback
-            try:
-                local_path = f"storage/certificates/{certificate_id}.png"
-                os.makedirs("storage/certificates", exist_ok=True)
-                with open(local_path, "wb") as f:
-                    f.write(certificate_buffer.getvalue())
-                print(f"[FALLBACK] Certificate saved locally: {local_path}")
-                # Use local URL as fallback
-                certificate_drive_result = {
-                    "id": "local_" + certificate_id,
-                    "image_url": f"/storage/certificates/{certificate_id}.png",
-                    "webViewLink": f"/storage/certificates/{certificate_id}.png",
-                    "webContentLink": f"/storage/certificates/{certificate_id}.png"
-                }
-            except Exception as fallback_error:
-                print(f"[ERROR] Fallback save also failed: {fallback_error}")
-                raise ValueError("Failed to upload certificate to Google Drive and fallback save failed")
-        
-        # Save QR code to Google Drive
-        qr_buffer = BytesIO()
-        qr_image.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-        
-        print(f"[DEBUG] Uploading QR code for certificate {certificate_id}")
-        print(f"[DEBUG] QR buffer size: {len(qr_buffer.getvalue())} bytes")
-        
-        qr_drive_result = self.drive_service.upload_from_bytes(
-            qr_buffer.getvalue(), f"{certificate_id}.png", "qr", max_retries=3
-        )
-        
-        print(f"[DEBUG] QR upload result: {qr_drive_result}")
-        
-        if not qr_drive_result:
-            print(f"[ERROR] Failed to upload QR code to Google Drive after retries")
-            # Try to save locally as fallback
-            try:
-                local_qr_path = f"storage/qr/{certificate_id}.png"
-                os.makedirs("storage/qr", exist_ok=True)
-                with open(local_qr_path, "wb") as f:
-                    f.write(qr_buffer.getvalue())
-                print(f"[FALLBACK] QR code saved locally: {local_qr_path}")
-                # Use local URL as fallback
-                qr_drive_result = {
-                    "id": "local_qr_" + certificate_id,
-                    "image_url": f"/storage/qr/{certificate_id}.png",
-                    "webViewLink": f"/storage/qr/{certificate_id}.png",
-                    "webContentLink": f"/storage/qr/{certificate_id}.png"
-                }
-            except Exception as fallback_error:
-                print(f"[ERROR] QR fallback save also failed: {fallback_error}")
-                # Continue without QR code
-                qr_drive_result = None
-        
-        if not qr_drive_result:
-            print("[ERROR] QR upload returned None or empty result")
-            raise ValueError("Failed to upload QR code to Google Drive")
-        
-        # Ensure URLs include file ID in parseable format for frontend
-        cert_file_id = certificate_drive_result.get('id', '')
-        qr_file_id = qr_drive_result.get('id', '')
-        
-        # Create URLs with file ID in parseable format
-        cert_image_url = certificate_drive_result.get('image_url', '')
-        if cert_file_id and not cert_image_url:
-            # If no image_url, create one with file ID
-            cert_image_url = f"https://drive.google.com/thumbnail?id={cert_file_id}&sz=w1000"
-        elif cert_file_id and 'id=' not in cert_image_url:
-            # If image_url exists but doesn't have file ID, replace with proper format
-            cert_image_url = f"https://drive.google.com/thumbnail?id={cert_file_id}&sz=w1000"
-        
-        qr_image_url = qr_drive_result.get('image_url', '')
-        if qr_file_id and not qr_image_url:
-            # If no image_url, create one with file ID
-            qr_image_url = f"https://drive.google.com/thumbnail?id={qr_file_id}&sz=w1000"
-        elif qr_file_id and 'id=' not in qr_image_url:
-            # If image_url exists but doesn't have file ID, replace with proper format
-            qr_image_url = f"https://drive.google.com/thumbnail?id={qr_file_id}&sz=w1000"
-        
-        # Save to student_details collection
-        student_data = {
-            "certificate_id": certificate_id,
-            "template_id": template_id,
-            "student_name": student_name,
-            "course_name": course_name,
-            "date_of_registration": date_str,
-            "image_path": cert_image_url,  # Display URL for frontend (with file ID)
-            "image_download_url": certificate_drive_result.get('download_url', f"https://drive.google.com/uc?id={cert_file_id}&export=download"),  # Download URL
-            "qr_path": qr_image_url,  # Display URL for frontend (with file ID)
-            "qr_download_url": qr_drive_result.get('download_url', f"https://drive.google.com/uc?id={qr_file_id}&export=download"),  # Download URL
-            "drive_certificate_id": cert_file_id,  # Store Drive file ID
-            "drive_qr_id": qr_file_id,  # Store Drive file ID
-            "issued_at": datetime.now(),
-            "verified": True,
-            "revoked": False,
-            "student_email": (student_email or ""),
-            "student_phone": "",  # Can be added later
-            "student_id": "",  # Can be added later
-            "institution": "Tech Buddy Space",  # Default institution
-            "grade": "",  # Can be added later
-            "instructor": "",  # Can be added later
-            "completion_hours": 0,  # Can be added later
-            "additional_notes": ""  # Can be added later
-        }
+            return ImageFont.truetype(_FONT_PATH, size)
+        except OSError as e:
+            logger.warning("Failed to load font %s: %s", _FONT_PATH, e)
+    
+    # Last resort: use default font with size tracking
+    font = ImageFont.load_default()
+    font.requested_size = size
+    return font
 
-        # Merge extra CSV fields generically, skipping empty values and reserved keys
-        reserved_keys = set(student_data.keys())
-        if extra_fields:
-            for key, value in extra_fields.items():
-                try:
-                    if key in reserved_keys:
-                        continue
-                    if value is None:
-                        continue
-                    value_str = str(value).strip()
-                    if not value_str:
-                        continue
-                    student_data[key] = value_str
-                except Exception:
-                    continue
+def _qr_assets(payload: str, size: int) -> Tuple[Image.Image, bytes]:
+    """QR image plus its PNG encoding (not cached: the payload carries the unique certificate ID)"""
+    qr_image = build_qr_image(payload, size)
+    qr_buffer = BytesIO()
+    qr_image.save(qr_buffer, format='PNG', compress_level=1, optimize=False)  # 1-bit, tiny either way
+    return qr_image, qr_buffer.getvalue()
 
-        # Persist
-        
-        self.student_details.insert_one(student_data)
-
-        # Fire-and-forget email if email is available (truly non-blocking)
-        # Don't await - let it run in background without blocking the response
-        if student_email:
-            download_url = student_data.get("image_download_url", student_data.get("image_path"))
-            verify_url = config.get_verify_url(certificate_id)
-            print(f"[EMAIL] Scheduling email send to {student_email} for {certificate_id} (non-blocking)")
-            
-            # Create background task that won't block the response
-            # This ensures certificate generation completes even if email fails
-            def send_email_background():
-                try:
-                    self._send_certificate_email_sync(
-                        to_email=student_email,
-                        student_name=student_name,
-                        course_name=course_name,
-                        certificate_id=certificate_id,
-                        date_str=date_str,
-                        download_url=download_url,
-                        verify_url=verify_url,
-                        extra_fields={k: v for k, v in (extra_fields or {}).items() if str(v).strip()}
-                    )
-                except Exception as e:
-                    print(f"[WARN] Background email send failed: {e}")
-            
-            # Schedule in background without awaiting
-            try:
-                asyncio.create_task(asyncio.to_thread(send_email_background))
-                print(f"[EMAIL] Email task scheduled (non-blocking)")
-            except Exception as e:
-                print(f"[WARN] Failed to schedule email send: {e}")
-                # Don't fail certificate generation if email scheduling fails
-        else:
-            print("[EMAIL] No student_email provided; skipping send")
+def _measure_text(font, text: str):
+    """Measure text width/height straight from the font (no ImageDraw context)"""
+    left, top, right, bottom = font.getbbox(text)
+    return right - left, bottom - top
 
-        return student_data
+# Text fields drawn on every certificate:
+# (placeholder key, default font size, default align, default vertical align, outline width)
+FIELD_DEFAULTS = [
+    ("student_name", 48, "center", "center", 2),
+    ("date", 18, "left", "center", 1),
+    ("certificate_no", 16, "left", "center", 1),
+]
+
+TEXT_COLOR = "#0b2a4a"  # Dark blue color
+
+def _index_placeholders(placeholders: List[Dict]) -> Dict[str, Dict]:
+    """Map placeholder key -> placeholder (first one wins, as the old linear scans did)"""
+    by_key = {}
+    for p in placeholders:
+        by_key.setdefault(p["key"], p)
+    return by_key
+
+def _fallback_position(key: str, text_width: int, text_height: int, img_width: int, img_height: int):
+    """Default spot for a field whose template has no placeholder for it"""
+    if key == "student_name":
+        return img_width // 2 - text_width // 2, img_height // 2 - 50 - text_height // 2
+    if key == "date":
+        return 50, img_height - 100 - text_height // 2
+    # Certificate number: right-aligned near the bottom-right corner
+    return img_width - 200 - text_width, img_height - 50 - text_height // 2
+
+def _calculate_text_position(text, font, x1, y1, x2, y2, text_align, vertical_align, device_type="desktop"):
+    """Calculate text position within a rectangle based on alignment settings with device-specific padding"""
+    text_width, text_height = _measure_text(font, text)
+    
+    # Calculate rectangle dimensions
+    rect_width = x2 - x1
+    rect_height = y2 - y1
+    
+    # Device-specific padding for 2000×1414 canvas
+    if device_type == "mobile":
+        # Adaptive mobile padding that scales better with rectangle size
+        # Use smaller minimum padding and cap maximum padding percentage
+        padding_x = max(6, min(rect_width * 0.08, rect_width * 0.12))
+        padding_y = max(4, min(rect_height * 0.08, rect_height * 0.15))
+    elif device_type == "desktop":
+        padding_x = max(5, rect_width * 0.05)  # Standard padding for desktop
+        padding_y = max(5, rect_height * 0.05)
+    else:
+        padding_x = max(6, rect_width * 0.06)  # Balanced padding for unknown devices
+        padding_y = max(4, rect_height * 0.08)
+    
+    logger.debug("Text positioning - Text: '%s', Rectangle: (%s, %s) to (%s, %s)", text, x1, y1, x2, y2)
+    logger.debug("Text positioning - Text size: %sx%s, Rectangle size: %sx%s", text_width, text_height, rect_width, rect_height)
+    logger.debug("Text positioning - Padding: X=%.1f, Y=%.1f", padding_x, padding_y)
+    
+    # Horizontal alignment with proper padding
+    if text_align == "left":
+        text_x = x1 + padding_x
+    elif text_align == "right":
+        text_x = x2 - text_width - padding_x
+    else:  # center
+        text_x = x1 + (rect_width - text_width) // 2
+    
+    # Vertical alignment with proper padding
+    if vertical_align == "top":
+        text_y = y1 + padding_y
+    elif vertical_align == "bottom":
+        text_y = y2 - text_height - padding_y
+    else:  # center
+        text_y = y1 + (rect_height - text_height) // 2
+    
+    # Ensure text stays within rectangle bounds
+    text_x = max(x1 + padding_x, min(text_x, x2 - text_width - padding_x))
+    text_y = max(y1 + padding_y, min(text_y, y2 - text_height - padding_y))
+    
+    logger.debug("Final text position - X: %s, Y: %s", text_x, text_y)
+    return text_x, text_y
+
+
+def _draw_field(draw, placeholder, text, default_size, default_align, default_v_align, stroke_width, device_multiplier, device_type):
+    """Draw one text field inside its placeholder rectangle"""
+    # Use raw pixel coordinates without scaling (fixed 2000×1414 canvas)
+    x1 = int(placeholder["x1"])
+    y1 = int(placeholder["y1"])
+    x2 = int(placeholder["x2"])
+    y2 = int(placeholder["y2"])
+    
+    raw_color = placeholder.get("color", TEXT_COLOR)
+    color = raw_color if raw_color and raw_color.startswith("#") else TEXT_COLOR
+    
+    # Use font size with device-specific adjustments
+    font = get_font(int(placeholder.get("font_size", default_size) * device_multiplier))
+    
+    x, y = _calculate_text_position(
+        text, font, x1, y1, x2, y2,
+        placeholder.get("text_align", default_align), placeholder.get("vertical_align", default_v_align), device_type
+    )
+    draw.text((x, y), text, font=font, fill=color, stroke_width=stroke_width, stroke_fill="white")
+    logger.debug("Drew %s at (%s, %s)", placeholder["key"], x, y)
+
+# Decoded 2000×1414 templates are ~8 MB each and cached per render worker, so keep this small.
+# Each upload gets its own Drive URL, so the path alone identifies the template version.
+@lru_cache(maxsize=8)
+def _load_template_image(template_path: str) -> Image.Image:
+    """Decoded template image, fetched and inflated once per template URL/path"""
+    # Load template image (handle both local and Google Drive URLs)
+    try:
+        template_image = Image.open(BytesIO(_fetch_template_bytes(template_path)))
+        template_image.load()
+    except requests.exceptions.RequestException as e:
+        raise ValueError(f"Template image not accessible from Google Drive: {str(e)}. The template may have been deleted from Google Drive.")
+    except Exception as e:
+        raise ValueError(f"Failed to load template image: {str(e)}")
+    
+    # Normalise palette/greyscale templates once so drawing and pasting stay on the
+    # direct RGB(A) code path instead of converting per operation
+    if template_image.mode not in ("RGB", "RGBA"):
+        has_alpha = template_image.mode in ("LA", "PA") or "transparency" in template_image.info
+        template_image = template_image.convert("RGBA" if has_alpha else "RGB")
+    return template_image
+
+def _render_certificate(template_path: str, placeholders_by_key: Dict[str, Dict], student_name: str, date_str: str,
+                        certificate_id: str, verification_url: str, device_type: str):
+    """Draw the certificate text and QR code onto the template; returns (certificate PNG, QR PNG) bytes.
+    
+    No database or Drive API access, so it can run in a worker process.
+    """
+    # Draw on a copy (a plain pixel-buffer memcpy) so the cached template stays pristine
+    template_image = _load_template_image(template_path).copy()
+    draw = ImageDraw.Draw(template_image)
+    
+    # Default fonts for templates without placeholders
+    font_large = get_font(48)
+    font_small = get_font(18)
+    
+    # Get image dimensions for positioning
+    img_width, img_height = template_image.size
+    
+    # Fixed resolution system: always work with the 2000×1414 pixel canvas and
+    # raw pixel coordinates, with device-specific adjustments
+    if device_type == "mobile":
+        device_multiplier = 1.2  # Larger fonts/padding for mobile readability
+    elif device_type == "desktop":
+        device_multiplier = 1.0  # Standard sizing for desktop
+    else:
+        device_multiplier = 1.05  # Balanced approach for unknown devices
+    
+    field_values = {"student_name": student_name, "date": date_str, "certificate_no": certificate_id}
+    for key, default_size, default_align, default_v_align, stroke_width in FIELD_DEFAULTS:
+        text = field_values[key]
+        placeholder = placeholders_by_key.get(key)
+        if placeholder and placeholder.get("x1") is not None:
+            _draw_field(
+                draw, placeholder, text, default_size, default_align, default_v_align,
+                stroke_width, device_multiplier, device_type
+            )
+        else:
+            # Fallback to default positioning
+            font = font_large if key == "student_name" else font_small
+            text_width, text_height = _measure_text(font, text)
+            position = _fallback_position(key, text_width, text_height, img_width, img_height)
+            draw.text(position, text, font=font, fill=TEXT_COLOR, stroke_width=stroke_width, stroke_fill="white")
+    
+    # Generate QR code
+    qr_size = 150
+    qr_image, qr_png = _qr_assets(verification_url, qr_size)
+    
+    # Paste QR code on certificate
+    qr_placeholder = placeholders_by_key.get("qr_code")
+    if qr_placeholder and qr_placeholder.get("x1") is not None:
+        # Use raw pixel coordinates without scaling (fixed 2000×1414 canvas)
+        qr_x = int(qr_placeholder["x1"])
+        qr_y = int(qr_placeholder["y1"])
+        logger.debug("QR code positioned at placeholder (%s, %s)", qr_x, qr_y)
+    else:
+        # Default position (bottom-right)
+        qr_x = template_image.width - qr_size - 50
+        qr_y = template_image.height - qr_size - 50
+        logger.debug("QR code positioned at default (%s, %s)", qr_x, qr_y)
+    
+    template_image.paste(qr_image, (qr_x, qr_y))
+    
+    certificate_buffer = BytesIO()
+    # Fast zlib level: encode time dominates generation, file size barely changes
+    template_image.save(certificate_buffer, format='PNG', compress_level=1, optimize=False)
+    return certificate_buffer.getvalue(), qr_png
 
-    def _build_email_html(self, student_name: str, course_name: str, certificate_id: str, date_str: str, download_url: str, verify_url: str, extra_fields: Optional[Dict[str, Any]] = None) -> str:
-        """Build the email HTML content"""
-        extra_fields_html = f"".join([f'''
+# Certificate email body, parsed once at import. The contact details are fixed, so
+# they are filled in here and only the per-certificate fields are substituted per send.
+_EMAIL_EXTRA_FIELD_ROW = string.Template('''
                   <tr>
-                    <td style="padding: 8px 0; color: #666; font-weight: bold;">{key.replace('_', ' ').title()}:</td>
-                    <td style="padding: 8px 0; color: #333;">{str(value)}</td>
+                    <td style="padding: 8px 0; color: #666; font-weight: bold;">${label}:</td>
+                    <td style="padding: 8px 0; color: #333;">${value}</td>
                   </tr>
-''' for key, value in (extra_fields or {}).items() if str(value).strip()])
-        
-        # Hardcoded contact information for email template
-        contact_email = "techbuddyspace@gmail.com"
-        website_url = "https://techbuddyspace.xyz"
-        contact_phone = "+919600338406"
-        instagram_url = "https://instagram.com/techbuddyspace"
-        
-        return f"""
+''')
+
+_EMAIL_HTML_TEMPLATE = string.Template(string.Template("""
 <html>
 <body style="font-family: 'Segoe UI', sans-serif; background-color: #f4f4f4; margin: 0; padding: 0;">
   <table role="presentation" width="100%" cellpadding="0" cellspacing="0" style="background-color: #f4f4f4; padding: 20px;">
@@ -888,38 +400,38 @@ class CertificateService:
                 <table role="presentation" width="100%" style="border-collapse: collapse;">
                   <tr>
                     <td style="padding: 8px 0; color: #666; font-weight: bold; width: 40%;">Certificate No:</td>
-                    <td style="padding: 8px 0; color: #333;">{certificate_id}</td>
+                    <td style="padding: 8px 0; color: #333;">${certificate_id}</td>
                   </tr>
                   <tr>
                     <td style="padding: 8px 0; color: #666; font-weight: bold;">Course Name:</td>
-                    <td style="padding: 8px 0; color: #333;">{course_name}</td>
+                    <td style="padding: 8px 0; color: #333;">${course_name}</td>
                   </tr>
                   <tr>
                     <td style="padding: 8px 0; color: #666; font-weight: bold;">Date:</td>
-                    <td style="padding: 8px 0; color: #333;">{date_str}</td>
+                    <td style="padding: 8px 0; color: #333;">${date_str}</td>
                   </tr>
                   <tr>
                     <td style="padding: 8px 0; color: #666; font-weight: bold;">Student Name:</td>
-                    <td style="padding: 8px 0; color: #333;">{student_name}</td>
+                    <td style="padding: 8px 0; color: #333;">${student_name}</td>
                   </tr>
-{extra_fields_html}
+${extra_fields_html}
                 </table>
               </div>
 
               <!-- Download Link -->
               <div style="text-align: center; margin: 30px 0;">
-                <a href="{download_url}" style="background-color: #2563eb; color: white; padding: 14px 28px; border-radius: 6px; text-decoration: none; font-weight: bold; margin: 5px; display: inline-block;">📥 Download Certificate</a>
+                <a href="${download_url}" style="background-color: #2563eb; color: white; padding: 14px 28px; border-radius: 6px; text-decoration: none; font-weight: bold; margin: 5px; display: inline-block;">📥 Download Certificate</a>
               </div>
 
               <p style="font-size: 14px; line-height: 1.6; color: #666; margin-top: 20px;">
                 <strong>Download Link:</strong><br>
-                <a href="{download_url}" style="color: #2563eb; word-break: break-all;">{download_url}</a>
+                <a href="${download_url}" style="color: #2563eb; word-break: break-all;">${download_url}</a>
               </p>
 
               <p style="font-size: 16px; margin-top: 30px;">
                 <strong>Warm regards,</strong><br>
                 <span style="font-weight: bold;">Team TechBuddySpace</span><br>
-                <a href="mailto:{contact_email}" style="color: #2563eb; text-decoration: none;">{contact_email}</a><br>
+                <a href="mailto:${contact_email}" style="color: #2563eb; text-decoration: none;">${contact_email}</a><br>
               </p>
             </td>
           </tr>
@@ -934,28 +446,28 @@ class CertificateService:
                 <tr>
                   <!-- Website -->
                   <td style="padding: 0 12px;">
-                    <a href="{website_url}" target="_blank" style="color: #888; text-decoration: none;">
+                    <a href="${website_url}" target="_blank" style="color: #888; text-decoration: none;">
                       <img src="https://cdn-icons-png.flaticon.com/512/1006/1006771.png" alt="Website" width="28" style="vertical-align: middle;" />
                     </a>
                   </td>
 
                   <!-- Email -->
                   <td style="padding: 0 12px;">
-                    <a href="mailto:{contact_email}">
+                    <a href="mailto:${contact_email}">
                       <img src="https://cdn-icons-png.flaticon.com/512/732/732200.png" alt="Email" width="28" style="vertical-align: middle;" />
                     </a>
                   </td>
 
                   <!-- Phone -->
                   <td style="padding: 0 12px;">
-                    <a href="tel:{contact_phone}">
+                    <a href="tel:${contact_phone}">
                       <img src="https://cdn-icons-png.flaticon.com/512/597/597177.png" alt="Call" width="28" style="vertical-align: middle;" />
                     </a>
                   </td>
 
                   <!-- Instagram -->
                   <td style="padding: 0 12px;">
-                    <a href="{instagram_url}" target="_blank">
+                    <a href="${instagram_url}" target="_blank">
                       <img src="https://cdn-icons-png.flaticon.com/512/174/174855.png" alt="Instagram" width="28" style="vertical-align: middle;" />
                     </a>
                   </td>
@@ -974,18 +486,506 @@ class CertificateService:
   </table>
 </body>
 </html>
-"""
+""").safe_substitute(
+    contact_email="techbuddyspace@gmail.com",
+    website_url="https://techbuddyspace.xyz",
+    contact_phone="+919600338406",
+    instagram_url="https://instagram.com/techbuddyspace",
+))
+
+# One authenticated SMTP session shared by the background email sends. A handshake
+# (TCP + TLS + AUTH) per recipient dominated bulk issuance; sends are serialised by the lock.
+_smtp_server: Optional[smtplib.SMTP] = None
+_smtp_lock = threading.Lock()
+
+def _connect_smtp(user: str, password: str) -> Optional[smtplib.SMTP]:
+    """Open an authenticated SMTP session: implicit TLS on port 465 (or SMTP_USE_SSL), else STARTTLS"""
+    smtp_timeout = 15
+    context = ssl.create_default_context()
+    if config.SMTP_USE_SSL or config.SMTP_PORT == 465:
+        try:
+            server = smtplib.SMTP_SSL(config.SMTP_HOST, config.SMTP_PORT, timeout=smtp_timeout, context=context)
+            server.login(user, password)
+            logger.info("Successfully connected via SSL (%s:%s)", config.SMTP_HOST, config.SMTP_PORT)
+            return server
+        except (OSError, smtplib.SMTPException) as e:
+            logger.error("SSL connection to port %s failed: %s: %s", config.SMTP_PORT, type(e).__name__, e)
+            return None
+    
+    # Try STARTTLS on configured port first, then fallback to 587
+    for port in dict.fromkeys([config.SMTP_PORT, 587]):
+        server = None
+        try:
+            logger.debug("Attempting STARTTLS connection to %s:%s", config.SMTP_HOST, port)
+            server = smtplib.SMTP(config.SMTP_HOST, port, timeout=smtp_timeout)
+            server.starttls(context=context)
+            server.login(user, password)
+            logger.info("Successfully connected via STARTTLS (%s:%s)", config.SMTP_HOST, port)
+            return server
+        except (OSError, smtplib.SMTPException) as e:
+            logger.error("STARTTLS connection to port %s failed: %s: %s", port, type(e).__name__, e)
+            _close_smtp(server)
+    
+    logger.error("All STARTTLS connection attempts failed")
+    return None
+
+def _close_smtp(server: Optional[smtplib.SMTP]):
+    """Quit an SMTP session, ignoring errors from an already-dead connection"""
+    if server is None:
+        return
+    try:
+        server.quit()
+    except Exception:
+        try:
+            server.close()
+        except Exception:
+            pass
+
+def _send_via_smtp(user: str, password: str, to_email: str, message: str) -> bool:
+    """Send one message over the shared SMTP session, reconnecting once if it has gone stale"""
+    global _smtp_server
+    with _smtp_lock:
+        for attempt in range(2):
+            if _smtp_server is None:
+                _smtp_server = _connect_smtp(user, password)
+                if _smtp_server is None:
+                    return False
+            try:
+                # Cheap liveness check; servers drop idle sessions
+                alive = _smtp_server.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                alive = False
+            if not alive:
+                logger.warning("SMTP session went stale (attempt %s), reconnecting", attempt + 1)
+                _close_smtp(_smtp_server)
+                _smtp_server = None
+                continue
+            try:
+                _smtp_server.sendmail(user, to_email, message)
+                return True
+            except smtplib.SMTPServerDisconnected as e:
+                logger.warning("SMTP session dropped (attempt %s): %s", attempt + 1, e)
+                _close_smtp(_smtp_server)
+                _smtp_server = None
+            except smtplib.SMTPException as e:
+                # The server answered (refused recipient/sender, rejected or failed DATA): final
+                # for this message, since retrying could resend mail it already accepted or refused
+                logger.error("Failed to send to %s: %s", to_email, e)
+                return False
+            except OSError as e:
+                logger.warning("SMTP connection error (attempt %s): %s", attempt + 1, e)
+                _close_smtp(_smtp_server)
+                _smtp_server = None
+    return False
+
+# Certificate rendering runs in worker processes; created lazily on first use. "spawn" keeps
+# workers from inheriting the parent's MongoDB/HTTP client threads and sockets.
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Shared process pool for certificate rendering"""
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=config.CERT_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _render_pool
+
+def shutdown_render_pool():
+    """Stop the render workers (called on application shutdown)"""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+class TemplateService:
+    def __init__(self, db):
+        self.db = db
+        self.templates = db.templates
+        # Use robust service for all environments - no fallback
+        self.drive_service = get_drive_service()
+        if not self.drive_service:
+            logger.warning("Template uploads will fail, but listing templates will work")
+
+    async def upload_template(self, file, template_name: str, description: str = "") -> str:
+        """Upload a template image and save metadata"""
+        # Check if Google Drive service is available
+        if not self.drive_service:
+            raise ValueError("Google Drive service is not available. Please check your GOOGLE_OAUTH_TOKEN environment variable.")
+        
+        # Generate template ID
+        now = datetime.now(timezone.utc)
+        template_id = f"TPL-{now.strftime('%Y%m%d')}-{secrets.token_hex(3).upper()}"
+        
+        # Validate file extension
+        file_extension = file.filename.split('.')[-1].lower()
+        if file_extension not in ['png', 'jpg', 'jpeg']:
+            raise ValueError("Only PNG, JPG, and JPEG files are allowed")
+        
+        # Upload to Google Drive, streaming the spooled upload file instead of reading it into memory
+        file_name = f"{template_id}.{file_extension}"
+        drive_result = await asyncio.to_thread(
+            self.drive_service.upload_from_bytes, file.file, file_name, "templates"
+        )
+        
+        if not drive_result:
+            raise ValueError("Failed to upload template to Google Drive. Please check your Google Drive credentials.")
+        
+        # Save to database with Google Drive URL
+        template_data = {
+            "template_id": template_id,
+            "name": template_name,
+            "description": description,
+            "image_path": drive_result['image_url'],  # Direct image URL for frontend display
+            "drive_file_id": drive_result['id'],  # Store Drive file ID for future operations
+            "placeholders": [],
+            "placeholders_by_key": {},
+            "uploaded_at": now
+        }
+        
+        await asyncio.to_thread(self.templates.insert_one, template_data)
+        invalidate_template_cache(template_id)
+        return template_id
+
+    async def set_placeholders(self, template_id: str, placeholders: List[Placeholder]):
+        """Set placeholder positions for a template"""
+        placeholder_docs = [p.model_dump() for p in placeholders]
+        # Store the key -> placeholder index alongside the list so generation does O(1) lookups
+        result = await asyncio.to_thread(
+            self.templates.update_one,
+            {"template_id": template_id},
+            {"$set": {"placeholders": placeholder_docs, "placeholders_by_key": _index_placeholders(placeholder_docs)}}
+        )
+        
+        invalidate_template_cache(template_id)
+        if result.matched_count == 0:
+            raise ValueError("Template not found")
+
+    async def get_template(self, template_id: str) -> Optional[Dict]:
+        """Get template by ID"""
+        return await asyncio.to_thread(self.templates.find_one, {"template_id": template_id}, {"_id": 0})
+
+    async def list_templates(self) -> List[Dict]:
+        """List templates (newest first), without their placeholder layouts"""
+        try:
+            # Listings only need identity and preview fields; the placeholder arrays are
+            # served by get_template when a single template is opened
+            templates = await asyncio.to_thread(lambda: list(
+                self.templates.find({}, TEMPLATE_LIST_PROJECTION).sort("uploaded_at", -1).limit(TEMPLATE_LIST_LIMIT)
+            ))
+            logger.debug("Returning %s templates", len(templates))
+            
+            if not templates:
+                logger.warning("No templates found in database")
+            
+            return templates
+        except Exception as e:
+            logger.exception("Error listing templates: %s", e)
+            raise
+
+class CertificateService:
+    def __init__(self, db):
+        self.db = db
+        self.student_details = db.student_details
+        self.templates = db.templates
+        # Use robust service for all environments - no fallback
+        self.drive_service = get_drive_service()
+        if not self.drive_service:
+            logger.warning("Certificate generation will fail, but other operations will work")
+
+    async def _get_cached_template(self, template_id: str) -> Dict:
+        """Template document, served from the in-process cache when possible"""
+        template = _template_cache.get(template_id)
+        if template is None:
+            template = await asyncio.to_thread(self.templates.find_one, {"template_id": template_id})
+            if not template:
+                raise ValueError("Template not found")
+            _template_cache[template_id] = template
+        return template
+
+    async def _issue_certificate(self, template: Dict, student_name: str, course_name: str, date_str: str, device_type: str, extra_fields: Optional[Dict[str, Any]], student_email: Optional[str]) -> Tuple[Dict, bytes]:
+        """Render and upload one certificate; returns the student_details document (not yet persisted) and the PNG bytes"""
+        now = datetime.now(timezone.utc)
+        
+        # Generate certificate ID
+        certificate_id = generate_certificate_id()
+        
+        # Render in a worker process so the CPU-bound drawing and PNG encoding
+        # neither block the event loop nor contend for the GIL
+        verification_url = config.get_verify_url(certificate_id)
+        certificate_png, qr_png = await asyncio.get_running_loop().run_in_executor(
+            get_render_pool(), _render_certificate,
+            template["image_path"],
+            # Templates saved before placeholders_by_key existed are indexed on the fly
+            template.get("placeholders_by_key") or _index_placeholders(template.get("placeholders", [])),
+            student_name, date_str, certificate_id, verification_url, device_type
+        )
+        
+        # Upload certificate and QR code to Google Drive concurrently (blocking HTTPS with
+        # retries, so off the event loop); each keeps its own local fallback below
+        certificate_drive_result, qr_drive_result = await asyncio.gather(
+            asyncio.to_thread(
+                self.drive_service.upload_from_bytes, certificate_png, f"{certificate_id}.png", "certificates", max_retries=3
+            ),
+            asyncio.to_thread(
+                self.drive_service.upload_from_bytes, qr_png, f"{certificate_id}.png", "qr", max_retries=3
+            ),
+            return_exceptions=True
+        )
+        if isinstance(certificate_drive_result, Exception):
+            logger.error("Certificate upload raised: %s", certificate_drive_result)
+            certificate_drive_result = None
+        if isinstance(qr_drive_result, Exception):
+            logger.error("QR upload raised: %s", qr_drive_result)
+            qr_drive_result = None
+        
+        if not certificate_drive_result:
+            logger.error("Failed to upload certificate to Google Drive after retries")
+            # Try to save locally as fallback
+            try:
+                local_path = f"storage/certificates/{certificate_id}.png"
+                os.makedirs("storage/certificates", exist_ok=True)
+                with open(local_path, "wb") as f:
+                    f.write(certificate_png)
+                logger.warning("Certificate saved locally: %s", local_path)
+                # Use local URL as fallback
+                certificate_drive_result = {
+                    "id": "local_" + certificate_id,
+                    "image_url": f"/storage/certificates/{certificate_id}.png",
+                    "webViewLink": f"/storage/certificates/{certificate_id}.png",
+                    "webContentLink": f"/storage/certificates/{certificate_id}.png"
+                }
+            except Exception as fallback_error:
+                logger.error("Fallback save also failed: %s", fallback_error)
+                raise ValueError("Failed to upload certificate to Google Drive and fallback save failed")
+        
+        logger.debug("QR upload result: %s", qr_drive_result)
+        
+        if not qr_drive_result:
+            logger.error("Failed to upload QR code to Google Drive after retries")
+            # Try to save locally as fallback
+            try:
+                local_qr_path = f"storage/qr/{certificate_id}.png"
+                os.makedirs("storage/qr", exist_ok=True)
+                with open(local_qr_path, "wb") as f:
+                    f.write(qr_png)
+                logger.warning("QR code saved locally: %s", local_qr_path)
+                # Use local URL as fallback
+                qr_drive_result = {
+                    "id": "local_qr_" + certificate_id,
+                    "image_url": f"/storage/qr/{certificate_id}.png",
+                    "webViewLink": f"/storage/qr/{certificate_id}.png",
+                    "webContentLink": f"/storage/qr/{certificate_id}.png"
+                }
+            except Exception as fallback_error:
+                logger.error("QR fallback save also failed: %s", fallback_error)
+                # Continue without QR code
+                qr_drive_result = None
+        
+        if not qr_drive_result:
+            logger.error("QR upload returned None or empty result")
+            raise ValueError("Failed to upload QR code to Google Drive")
+        
+        # Ensure URLs include file ID in parseable format for frontend
+        cert_file_id = certificate_drive_result.get('id', '')
+        qr_file_id = qr_drive_result.get('id', '')
+        
+        # Create URLs with file ID in parseable format
+        cert_image_url = certificate_drive_result.get('image_url', '')
+        if cert_file_id and not cert_image_url:
+            # If no image_url, create one with file ID
+            cert_image_url = f"https://drive.google.com/thumbnail?id={cert_file_id}&sz=w1000"
+        elif cert_file_id and 'id=' not in cert_image_url:
+            # If image_url exists but doesn't have file ID, replace with proper format
+            cert_image_url = f"https://drive.google.com/thumbnail?id={cert_file_id}&sz=w1000"
+        
+        qr_image_url = qr_drive_result.get('image_url', '')
+        if qr_file_id and not qr_image_url:
+            # If no image_url, create one with file ID
+            qr_image_url = f"https://drive.google.com/thumbnail?id={qr_file_id}&sz=w1000"
+        elif qr_file_id and 'id=' not in qr_image_url:
+            # If image_url exists but doesn't have file ID, replace with proper format
+            qr_image_url = f"https://drive.google.com/thumbnail?id={qr_file_id}&sz=w1000"
+        
+        # Save to student_details collection
+        student_data = {
+            "certificate_id": certificate_id,
+            "template_id": template["template_id"],
+            "student_name": student_name,
+            "course_name": course_name,
+            "date_of_registration": date_str,
+            "image_path": cert_image_url,  # Display URL for frontend (with file ID)
+            "image_download_url": certificate_drive_result.get('download_url', f"https://drive.google.com/uc?id={cert_file_id}&export=download"),  # Download URL
+            "qr_path": qr_image_url,  # Display URL for frontend (with file ID)
+            "qr_download_url": qr_drive_result.get('download_url', f"https://drive.google.com/uc?id={qr_file_id}&export=download"),  # Download URL
+            "drive_certificate_id": cert_file_id,  # Store Drive file ID
+            "drive_qr_id": qr_file_id,  # Store Drive file ID
+            "issued_at": now,
+            "verified": True,
+            "revoked": False,
+            "student_email": (student_email or ""),
+            "student_phone": "",  # Can be added later
+            "student_id": "",  # Can be added later
+            "institution": "Tech Buddy Space",  # Default institution
+            "grade": "",  # Can be added later
+            "instructor": "",  # Can be added later
+            "completion_hours": 0,  # Can be added later
+            "additional_notes": ""  # Can be added later
+        }
+
+        # Merge extra CSV fields generically, skipping empty values and reserved keys
+        student_data.update({
+            key: value_str
+            for key, value in (extra_fields or {}).items()
+            if key not in student_data and value is not None and (value_str := str(value).strip())
+        })
+        return student_data, certificate_png
+
+    def _schedule_certificate_email(self, student_data: Dict, extra_fields: Optional[Dict[str, Any]] = None, certificate_bytes: Optional[bytes] = None):
+        """Fire-and-forget the certificate email for a persisted certificate (truly non-blocking)"""
+        student_email = student_data.get("student_email")
+        if not student_email:
+            logger.info("No student_email provided; skipping send")
+            return
+        
+        certificate_id = student_data["certificate_id"]
+        download_url = student_data.get("image_download_url", student_data.get("image_path"))
+        verify_url = config.get_verify_url(certificate_id)
+        logger.info("Scheduling email send to %s for %s (non-blocking)", student_email, certificate_id)
+        
+        # Create background task that won't block the response
+        # This ensures certificate generation completes even if email fails
+        def send_email_background():
+            try:
+                self._send_certificate_email_sync(
+                    to_email=student_email,
+                    student_name=student_data["student_name"],
+                    course_name=student_data["course_name"],
+                    certificate_id=certificate_id,
+                    date_str=student_data["date_of_registration"],
+                    download_url=download_url,
+                    verify_url=verify_url,
+                    extra_fields={k: v for k, v in (extra_fields or {}).items() if str(v).strip()},
+                    certificate_bytes=certificate_bytes,
+                    attach_certificate=config.EMAIL_ATTACH_CERTIFICATE
+                )
+            except Exception as e:
+                logger.warning("Background email send failed: %s", e)
+        
+        # Schedule in background without awaiting; keep a reference so the task isn't garbage collected
+        try:
+            task = asyncio.create_task(asyncio.to_thread(send_email_background))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+            logger.debug("Email task scheduled (non-blocking)")
+        except Exception as e:
+            logger.warning("Failed to schedule email send: %s", e)
+            # Don't fail certificate generation if email scheduling fails
+
+    async def generate_certificate(self, template_id: str, student_name: str, course_name: str, date_str: str, device_type: str = "desktop", extra_fields: Optional[Dict[str, Any]] = None, student_email: Optional[str] = None) -> Dict:
+        """Generate a certificate with text overlay and QR code"""
+        # Check if Google Drive service is available
+        if not self.drive_service:
+            raise ValueError("Google Drive service is not available. Please check your GOOGLE_OAUTH_TOKEN environment variable.")
+        
+        template = await self._get_cached_template(template_id)
+        student_data, certificate_png = await self._issue_certificate(
+            template, student_name, course_name, date_str, device_type, extra_fields, student_email
+        )
+        
+        # Persist
+        await asyncio.to_thread(self.student_details.insert_one, student_data)
+        
+        # Attach the PNG we just rendered instead of downloading it back from Drive
+        self._schedule_certificate_email(student_data, extra_fields, certificate_bytes=certificate_png)
+        return student_data
+
+    async def generate_certificates_bulk(self, template_id: str, students: List[Dict[str, Any]], device_type: str = "desktop") -> Tuple[List[Tuple[int, Dict]], List[Tuple[int, str]]]:
+        """Generate certificates for many students and persist them with batched writes.
+        
+        Each student dict carries student_name, date_str and optionally course_name, extra_fields
+        and student_email. Returns (issued, failed) as lists of (index into students, document or error).
+        """
+        if not self.drive_service:
+            raise ValueError("Google Drive service is not available. Please check your GOOGLE_OAUTH_TOKEN environment variable.")
+        
+        template = await self._get_cached_template(template_id)
+        
+        # Issue rows concurrently (render in the worker pool, Drive uploads in threads), bounded so
+        # bursts of uploads stay under Drive's per-user write quota
+        semaphore = asyncio.Semaphore(config.BULK_ISSUE_CONCURRENCY)
+        
+        async def issue(index: int, student: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    # PNG bytes are dropped here: holding every render until the emails go out
+                    # would keep the whole batch in memory, so bulk emails fetch from Drive
+                    student_data, _ = await self._issue_certificate(
+                        template, student["student_name"], student.get("course_name", ""), student["date_str"],
+                        device_type, student.get("extra_fields"), student.get("student_email")
+                    )
+                    return index, student_data, None
+                except Exception as e:
+                    logger.warning("Bulk generation failed for row %s: %s", index + 1, e)
+                    return index, None, str(e)
+        
+        results = await asyncio.gather(*(issue(index, student) for index, student in enumerate(students)))
+        issued = [(index, student_data) for index, student_data, error in results if error is None]
+        failed = [(index, error) for index, _, error in results if error is not None]
+        
+        # One round-trip per batch instead of per certificate; unordered so a bad row
+        # does not stop the rest of the batch from being written
+        rejected = set()
+        for offset in range(0, len(issued), BULK_WRITE_BATCH_SIZE):
+            batch = issued[offset:offset + BULK_WRITE_BATCH_SIZE]
+            try:
+                await asyncio.to_thread(self.student_details.insert_many, [doc for _, doc in batch], ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    index = batch[write_error["index"]][0]
+                    logger.warning("Bulk insert failed for row %s: %s", index + 1, write_error.get("errmsg"))
+                    rejected.add(index)
+                    failed.append((index, write_error.get("errmsg", "Database write failed")))
+            except PyMongoError as e:
+                # Connection/timeout errors: the outcome of this batch is unknown, so report every
+                # row in it and carry on with the remaining batches and the emails
+                logger.error("Bulk insert of rows %s-%s failed: %s", batch[0][0] + 1, batch[-1][0] + 1, e)
+                for index, _ in batch:
+                    rejected.add(index)
+                    failed.append((index, f"Database write failed: {e}"))
+        
+        if rejected:
+            issued = [(index, doc) for index, doc in issued if index not in rejected]
+            failed.sort()
+        
+        for index, student_data in issued:
+            self._schedule_certificate_email(student_data, students[index].get("extra_fields"))
+        return issued, failed
+
+    def _build_email_html(self, student_name: str, course_name: str, certificate_id: str, date_str: str, download_url: str, verify_url: str, extra_fields: Optional[Dict[str, Any]] = None) -> str:
+        """Build the email HTML content"""
+        extra_fields_html = "".join(
+            _EMAIL_EXTRA_FIELD_ROW.substitute(label=key.replace('_', ' ').title(), value=str(value))
+            for key, value in (extra_fields or {}).items() if str(value).strip()
+        )
+        return _EMAIL_HTML_TEMPLATE.substitute(
+            student_name=student_name,
+            course_name=course_name,
+            certificate_id=certificate_id,
+            date_str=date_str,
+            download_url=download_url,
+            extra_fields_html=extra_fields_html,
+        )
 
-    def _send_certificate_email_sync(self, to_email: str, student_name: str, course_name: str, certificate_id: str, date_str: str, download_url: str, verify_url: str, extra_fields: Optional[Dict[str, Any]] = None):
-        print(f"[EMAIL] Starting email send to {to_email} for {student_name}")
+    def _send_certificate_email_sync(self, to_email: str, student_name: str, course_name: str, certificate_id: str, date_str: str, download_url: str, verify_url: str, extra_fields: Optional[Dict[str, Any]] = None, certificate_bytes: Optional[bytes] = None, attach_certificate: bool = False):
+        logger.debug("Starting email send to %s for %s", to_email, student_name)
         
         # Check if SMTP microservice URL is configured
         smtp_service_url = config.SMTP_SERVICE_URL
         if smtp_service_url:
             # Use SMTP microservice (via ngrok)
-            print(f"[EMAIL] Using SMTP microservice at: {smtp_service_url}")
+            logger.debug("Using SMTP microservice at: %s", smtp_service_url)
             try:
-                import requests
                 payload = {
                     "to_email": to_email,
                     "student_name": student_name,
@@ -1002,7 +1002,7 @@ class CertificateService:
                 if "ngrok" in smtp_service_url:
                     headers["ngrok-skip-browser-warning"] = "true"
                 
-                response = requests.post(
+                response = _http_session.post(
                     f"{smtp_service_url}/send-email",
                     json=payload,
                     headers=headers,
@@ -1011,61 +1011,27 @@ class CertificateService:
                 
                 if response.status_code == 200:
                     result = response.json()
-                    print(f"[EMAIL] ✅ Email sent successfully via microservice: {result.get('message', '')}")
+                    logger.info("Email sent successfully via microservice: %s", result.get('message', ''))
                     return
                 else:
-                    print(f"[EMAIL] ❌ SMTP microservice returned error: {response.status_code} - {response.text}")
+                    logger.error("SMTP microservice returned error: %s - %s", response.status_code, response.text)
                     raise Exception(f"SMTP microservice error: {response.status_code}")
                     
             except Exception as e:
-                print(f"[EMAIL] ❌ Failed to send email via SMTP microservice: {e}")
-                print(f"[EMAIL] Email will not be sent. Certificate generation will continue.")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Failed to send email via SMTP microservice: %s", e)
+                logger.warning("Email will not be sent. Certificate generation will continue.")
                 return
         else:
             # Fallback: Direct SMTP (for localhost development only)
-            print(f"[EMAIL] SMTP_SERVICE_URL not configured, attempting direct SMTP (localhost only)")
-            print(f"[EMAIL] Note: Direct SMTP will fail on Render. Use SMTP microservice for production.")
+            logger.debug("SMTP_SERVICE_URL not configured, attempting direct SMTP (localhost only)")
+            logger.warning("Direct SMTP will fail on Render. Use SMTP microservice for production.")
             
             # SMTP credentials from config
             email = config.SMTP_USER
             password = config.SMTP_PASS
             
             if not (email and password):
-                print("[WARN] SMTP credentials not configured; skipping email send")
-                return
-
-            # SMTP setup - use STARTTLS only (no SSL method)
-            server = None
-            smtp_timeout = 15
-            
-            # Try STARTTLS on configured port first, then fallback to 587
-            ports_to_try = [config.SMTP_PORT, 587]
-            
-            for port in ports_to_try:
-                try:
-                    print(f"[EMAIL] Attempting STARTTLS connection to {config.SMTP_HOST}:{port}")
-                    context = ssl.create_default_context()
-                    server = smtplib.SMTP(config.SMTP_HOST, port, timeout=smtp_timeout)
-                    server.starttls(context=context)
-                    server.login(email, password)
-                    print(f"[EMAIL] ✅ Successfully connected via STARTTLS ({config.SMTP_HOST}:{port})")
-                    break
-                    
-                except (OSError, smtplib.SMTPException, Exception) as e:
-                    print(f"[EMAIL] ❌ STARTTLS connection to port {port} failed: {type(e).__name__}: {e}")
-                    if server:
-                        try:
-                            server.quit()
-                        except:
-                            pass
-                        server = None
-                    continue
-            
-            if server is None:
-                print(f"[ERROR] All STARTTLS connection attempts failed")
-                print(f"[EMAIL] Email will not be sent. Certificate generation will continue.")
+                logger.warning("SMTP credentials not configured; skipping email send")
                 return
 
             # Create the email - use "mixed" to properly handle HTML body + file attachment
@@ -1081,55 +1047,42 @@ class CertificateService:
             html_body = MIMEText(html, "html")
             message.attach(html_body)
 
-            # Try to fetch and attach the certificate image
-            attachment_added = False
-            try:
-                import requests
-                import re
-                print(f"[EMAIL] Attempting to download certificate from: {download_url}")
-                
-                download_url_final = download_url
-                if "drive.google.com" in download_url:
-                    file_id_match = re.search(r'[?&]id=([^&]+)', download_url)
-                    if file_id_match:
-                        file_id = file_id_match.group(1)
-                        download_url_final = f"https://drive.google.com/uc?id={file_id}&export=download"
-                
-                resp = requests.get(download_url_final, timeout=30, allow_redirects=True)
-                if resp.ok and resp.content and not attachment_added:
-                    content_type = resp.headers.get('Content-Type', 'image/png')
-                    if 'image' in content_type:
-                        part = MIMEBase('image', 'png')
-                        part.set_payload(resp.content)
-                        encoders.encode_base64(part)
-                        filename = f"{student_name.replace(' ', '_')}_{certificate_id}.png"
-                        part.add_header('Content-Disposition', f'attachment; filename="{filename}"')
-                        message.attach(part)
-                        attachment_added = True
-                        print(f"[EMAIL] Certificate image attached: {filename}")
-            except Exception as e:
-                print(f"[EMAIL] Info: Could not attach certificate file; sending email without attachment. Reason: {e}")
-
-            # Send the email
-            try:
-                server.sendmail(email, to_email, message.as_string())
-                print(f"✅ Sent to {student_name} <{to_email}>")
-            except Exception as e:
-                print(f"❌ Failed to send to {to_email}: {e}")
-            finally:
-                if server:
-                    try:
-                        server.quit()
-                    except:
-                        try:
-                            server.close()
-                        except:
-                            pass
+            # Link-only by default: the body already has a download button, and skipping the
+            # attachment avoids fetching and base64-encoding ~1 MB per message
+            filename = f"{student_name.replace(' ', '_')}_{certificate_id}.png"
+            if attach_certificate and certificate_bytes is None:
+                # Try to fetch the certificate image when the caller doesn't have the bytes
+                try:
+                    logger.debug("Attempting to download certificate from: %s", download_url)
+                    
+                    download_url_final = download_url
+                    if "drive.google.com" in download_url:
+                        file_id_match = re.search(r'[?&]id=([^&]+)', download_url)
+                        if file_id_match:
+                            file_id = file_id_match.group(1)
+                            download_url_final = f"https://drive.google.com/uc?id={file_id}&export=download"
+                    
+                    resp = _http_session.get(download_url_final, timeout=30, allow_redirects=True)
+                    if resp.ok and resp.content and 'image' in resp.headers.get('Content-Type', 'image/png'):
+                        certificate_bytes = resp.content
+                except Exception as e:
+                    logger.info("Could not attach certificate file; sending email without attachment. Reason: %s", e)
+            
+            if attach_certificate and certificate_bytes:
+                part = MIMEImage(certificate_bytes, _subtype='png')
+                part.add_header('Content-Disposition', f'attachment; filename="{filename}"')
+                message.attach(part)
+                logger.info("Certificate image attached: %s", filename)
 
+            # Send the email over the shared SMTP session
+            if _send_via_smtp(email, password, to_email, message.as_string()):
+                logger.info("Sent to %s <%s>", student_name, to_email)
+            else:
+                logger.warning("Email will not be sent. Certificate generation will continue.")
 
     async def get_certificate(self, certificate_id: str) -> Optional[Dict]:
         """Get certificate by ID"""
-        cert = self.student_details.find_one({"certificate_id": certificate_id})
+        cert = await asyncio.to_thread(self.student_details.find_one, {"certificate_id": certificate_id})
         if cert:
             cert["_id"] = str(cert["_id"])
             
@@ -1151,21 +1104,26 @@ class CertificateService:
             
         return cert
 
-    async def list_certificates(self) -> List[Dict]:
-        """List all certificates"""
-        certs = list(self.student_details.find({}, {"_id": 0}))
-        return certs
+    async def list_certificates(self, skip: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """List certificates, optionally one page at a time (no limit returns everything)"""
+        def fetch():
+            cursor = self.student_details.find({}, {"_id": 0}).skip(skip)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+        return await asyncio.to_thread(fetch)
 
     async def revoke_certificate(self, certificate_id: str, reason: str = ""):
         """Revoke a certificate"""
-        result = self.student_details.update_one(
+        result = await asyncio.to_thread(
+            self.student_details.update_one,
             {"certificate_id": certificate_id},
             {
                 "$set": {
                     "verified": False,
                     "revoked": True,
                     "revoked_reason": reason,
-                    "revoked_at": datetime.now()
+                    "revoked_at": datetime.now(timezone.utc)
                 }
             }
         )
@@ -1176,43 +1134,93 @@ class CertificateService:
     async def delete_certificate(self, certificate_id: str):
         """Delete a certificate completely from database and Google Drive"""
         # Get certificate details first
-        certificate = self.student_details.find_one({"certificate_id": certificate_id})
+        certificate = await asyncio.to_thread(self.student_details.find_one, {"certificate_id": certificate_id})
         if not certificate:
             raise ValueError("Certificate not found")
         
         # Delete files from Google Drive
         try:
             if certificate.get("drive_certificate_id"):
-                success = self.drive_service.delete_file(certificate["drive_certificate_id"])
+                success = await asyncio.to_thread(self.drive_service.delete_file, certificate["drive_certificate_id"])
                 if success:
-                    print(f"Deleted certificate image from Google Drive: {certificate['drive_certificate_id']}")
+                    logger.info("Deleted certificate image from Google Drive: %s", certificate['drive_certificate_id'])
                 else:
-                    print(f"Warning: Could not delete certificate image from Google Drive")
+                    logger.warning("Could not delete certificate image from Google Drive")
         except Exception as e:
-            print(f"Warning: Could not delete certificate image from Google Drive: {e}")
+            logger.warning("Could not delete certificate image from Google Drive: %s", e)
         
         try:
             if certificate.get("drive_qr_id"):
-                success = self.drive_service.delete_file(certificate["drive_qr_id"])
+                success = await asyncio.to_thread(self.drive_service.delete_file, certificate["drive_qr_id"])
                 if success:
-                    print(f"Deleted QR code from Google Drive: {certificate['drive_qr_id']}")
+                    logger.info("Deleted QR code from Google Drive: %s", certificate['drive_qr_id'])
                 else:
-                    print(f"Warning: Could not delete QR code from Google Drive")
+                    logger.warning("Could not delete QR code from Google Drive")
         except Exception as e:
-            print(f"Warning: Could not delete QR code from Google Drive: {e}")
+            logger.warning("Could not delete QR code from Google Drive: %s", e)
         
         # Delete from student_details collection
-        result = self.student_details.delete_one({"certificate_id": certificate_id})
+        result = await asyncio.to_thread(self.student_details.delete_one, {"certificate_id": certificate_id})
         
         if result.deleted_count == 0:
             raise ValueError("Certificate not found")
         
         # Also delete verification logs for this certificate
         try:
-            verification_result = self.db.certificates.delete_many({"certificate_id": certificate_id})
-            print(f"Deleted {verification_result.deleted_count} verification logs for certificate {certificate_id}")
+            verification_result = await asyncio.to_thread(self.db.certificates.delete_many, {"certificate_id": certificate_id})
+            logger.info("Deleted %s verification logs for certificate %s", verification_result.deleted_count, certificate_id)
+        except Exception as e:
+            logger.warning("Could not delete verification logs: %s", e)
+
+    async def revoke_certificates(self, certificate_ids: List[str], reason: str = "") -> int:
+        """Revoke several certificates in a single database round-trip"""
+        result = await asyncio.to_thread(
+            self.student_details.update_many,
+            {"certificate_id": {"$in": certificate_ids}},
+            {
+                "$set": {
+                    "verified": False,
+                    "revoked": True,
+                    "revoked_reason": reason,
+                    "revoked_at": datetime.now(timezone.utc)
+                }
+            }
+        )
+        return result.matched_count
+
+    async def delete_certificates(self, certificate_ids: List[str]) -> int:
+        """Delete several certificates from database and Google Drive in one pass"""
+        certificates = await asyncio.to_thread(lambda: list(self.student_details.find(
+            {"certificate_id": {"$in": certificate_ids}},
+            {"_id": 0, "drive_certificate_id": 1, "drive_qr_id": 1}
+        )))
+        if not certificates:
+            return 0
+        
+        # Drive deletes share one googleapiclient service (httplib2 is not thread-safe),
+        # so run them sequentially in a worker thread to keep the event loop free
+        drive_ids = [
+            file_id
+            for certificate in certificates
+            for file_id in (certificate.get("drive_certificate_id"), certificate.get("drive_qr_id"))
+            if file_id and not file_id.startswith("local_")
+        ]
+        if drive_ids and self.drive_service:
+            deleted = await asyncio.to_thread(
+                lambda: sum(self.drive_service.delete_file(file_id) for file_id in drive_ids)
+            )
+            logger.info("Deleted %s/%s files from Google Drive", deleted, len(drive_ids))
+        
+        result = await asyncio.to_thread(self.student_details.delete_many, {"certificate_id": {"$in": certificate_ids}})
+        
+        # Also delete verification logs for these certificates
+        try:
+            verification_result = await asyncio.to_thread(self.db.certificates.delete_many, {"certificate_id": {"$in": certificate_ids}})
+            logger.info("Deleted %s verification logs for %s certificates", verification_result.deleted_count, result.deleted_count)
         except Exception as e:
-            print(f"Warning: Could not delete verification logs: {e}")
+            logger.warning("Could not delete verification logs: %s", e)
+        
+        return result.deleted_count
 
 class QRService:
     def __init__(self):
@@ -1220,9 +1228,4 @@ class QRService:
     
     def generate_qr(self, data: str, size: int = 150) -> Image.Image:
         """Generate QR code image"""
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(data)
-        qr.make(fit=True)
-        
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        return qr_image.resize((size, size))
+        return build_qr_image(data, size)
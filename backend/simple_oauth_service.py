@@ -5,77 +5,216 @@ Simple OAuth Google Drive service that handles the flow properly
 
 import os
 import json
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import MediaIoBaseUpload, build_http
+from googleapiclient.errors import HttpError
+import google_auth_httplib2
 from google.auth.transport.requests import Request
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Set, Tuple, Union, BinaryIO
 import io
+import logging
+from functools import lru_cache
+from utils import escape_drive_query
+
+try:
+    # Optional faster parser for the ~200 KB discovery document and the OAuth JSON
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# Uploads above this size use a resumable session sent in chunks of RESUMABLE_CHUNK_SIZE
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+RESUMABLE_CHUNK_SIZE = 5 * 1024 * 1024
+
+# Publicly shared folder IDs persisted across restarts; an entry is re-resolved when Drive 404s on it
+FOLDER_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.drive_folder_cache.json')
+
+# Concurrent uploads for upload_many_async; keeps bursts under Drive's per-user write rate
+UPLOAD_CONCURRENCY = 10
+
+# Seconds before a Drive HTTP request is abandoned
+HTTP_TIMEOUT = 120
+
+PUBLIC_READER_PERMISSION = {'role': 'reader', 'type': 'anyone'}
+# Drive accepts at most 100 calls per batch request
+BATCH_MAX_CALLS = 100
+
+# Credentials and built Drive clients shared by every instance in the process, keyed by OAuth
+# client + refresh token, so re-instantiating the service neither refreshes nor rebuilds again
+_TOKEN_CACHE: Dict[str, Tuple[Credentials, Any]] = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+def _load_folder_cache() -> Dict[str, str]:
+    """Folder IDs saved by a previous run (empty if missing or unreadable)"""
+    try:
+        with open(FOLDER_CACHE_FILE) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {name: folder_id for name, folder_id in data.items() if isinstance(folder_id, str)} if isinstance(data, dict) else {}
+
+def _save_folder_cache():
+    """Persist the resolved folders that are publicly shared; failing to write only costs a lookup on the next start"""
+    shared = {name: folder_id for name, folder_id in _FOLDER_IDS.items() if folder_id in _SHARED_FOLDER_IDS}
+    try:
+        with open(FOLDER_CACHE_FILE, 'w') as f:
+            json.dump(shared, f)
+    except OSError as e:
+        logger.warning("Could not save folder cache: %s", e)
+
+# Folder name -> Drive ID shared by every instance in the process, seeded once from FOLDER_CACHE_FILE
+_FOLDER_IDS: Dict[str, str] = {}
+# Folder IDs confirmed to carry the public reader permission. Kept apart from _FOLDER_IDS, which
+# also holds folders that were resolved but never (successfully) shared
+_SHARED_FOLDER_IDS: Set[str] = set()
+_folder_ids_loaded = False
+
+def _known_folder_ids() -> Dict[str, str]:
+    """Process-wide folder ID cache, loading the on-disk cache on first use"""
+    global _folder_ids_loaded
+    if not _folder_ids_loaded:
+        for folder_name, folder_id in _load_folder_cache().items():
+            _FOLDER_IDS.setdefault(folder_name, folder_id)
+            # Only shared folders are ever written to the file
+            _SHARED_FOLDER_IDS.add(folder_id)
+        _folder_ids_loaded = True
+    return _FOLDER_IDS
+
+# Drive responses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+def _execute_with_backoff(request, http=None, max_retries: int = 5, base: float = 1.0, cap: float = 30.0, jitter: float = 0.5):
+    """Execute a Drive API request, retrying 429/5xx with jittered exponential backoff.
+    
+    Honours Retry-After when Drive sends one; any other HttpError is raised immediately.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return request.execute(http=http)
+        except HttpError as e:
+            if e.resp.status not in RETRYABLE_STATUSES or attempt == max_retries:
+                raise
+            delay = min(cap, base * 2 ** attempt * (1 + random.random() * jitter))
+            try:
+                delay = max(delay, float(e.resp.get('retry-after', 0)))
+            except ValueError:
+                pass
+            logger.warning("Drive returned %s, retrying in %.1fs (%s/%s)", e.resp.status, delay, attempt + 1, max_retries)
+            time.sleep(delay)
+
+@lru_cache(maxsize=None)
+def _drive_discovery_doc() -> Dict[str, Any]:
+    """Drive v3 discovery document bundled with googleapiclient, parsed once per process"""
+    return _json_loads(get_static_doc('drive', 'v3'))
+
+def _token_cache_key(creds: Credentials) -> Optional[str]:
+    """Cache key for credentials that can refresh themselves, None otherwise"""
+    if not (creds.client_id and creds.refresh_token):
+        return None
+    return hashlib.sha256((creds.client_id + creds.refresh_token).encode()).hexdigest()
+
+def _token_expiring(creds: Credentials) -> bool:
+    """Whether the access token is expired or expires within a minute"""
+    return not creds.valid or bool(creds.expiry and creds.expiry <= datetime.utcnow() + timedelta(seconds=60))
 
 class SimpleOAuthGoogleDriveService:
     def __init__(self):
         self.SCOPES = ['https://www.googleapis.com/auth/drive']
         self.service = None
+        self.credentials = None
+        # Per-thread HTTP clients: async uploads run in worker threads and httplib2 is not thread-safe
+        self._local = threading.local()
         self.folders = {
             "certificates": None,
             "templates": None,
             "qr_codes": None
         }
+        # Folders shared with "anyone with the link"; files inside inherit public read access,
+        # so uploads into them skip the per-file permission call
+        self.public_folders = set()
         self.authenticate()
         self.setup_folders()
 
     def authenticate(self):
         """Authenticate using OAuth"""
         try:
-            print("[AUTH] Starting OAuth authentication...")
+            logger.debug("Starting OAuth authentication...")
             
             # Try to load from environment variable first
             token_env = os.getenv('GOOGLE_OAUTH_TOKEN')
+            token_file = 'token.json'
             creds = None
             
             if token_env:
-                print("[AUTH] Loading token from environment...")
+                logger.debug("Loading token from environment...")
                 try:
-                    token_data = json.loads(token_env)
+                    token_data = _json_loads(token_env)
                     creds = Credentials.from_authorized_user_info(token_data)
-                    print("[AUTH] Token loaded from environment successfully")
+                    logger.debug("Token loaded from environment successfully")
                 except Exception as e:
-                    print(f"[ERROR] Failed to load token from environment: {e}")
+                    logger.error("Failed to load token from environment: %s", e)
                     creds = None
             
             # If no token from environment, try file
             if not creds:
-                token_file = 'token.json'
                 if os.path.exists(token_file):
-                    print("[AUTH] Loading existing token from file...")
+                    logger.debug("Loading existing token from file...")
                     try:
                         creds = Credentials.from_authorized_user_file(token_file, self.SCOPES)
-                        print("[AUTH] Token loaded from file successfully")
+                        logger.debug("Token loaded from file successfully")
                     except Exception as e:
-                        print(f"[ERROR] Failed to load token from file: {e}")
+                        logger.error("Failed to load token from file: %s", e)
                         creds = None
             
             # If still no token, try OAuth credentials
             if not creds:
                 oauth_credentials = os.getenv('GOOGLE_OAUTH_CREDENTIALS')
                 if oauth_credentials:
-                    print("[AUTH] OAuth credentials found, but no valid token")
-                    print("[AUTH] OAuth flow would be required")
+                    logger.info("OAuth credentials found, but no valid token")
+                    logger.info("OAuth flow would be required")
                     self.service = None
                     return
                 else:
-                    print("[ERROR] No OAuth credentials or token found")
+                    logger.error("No OAuth credentials or token found")
                     self.service = None
                     return
             
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    print("[AUTH] Refreshing expired token...")
+            # Reuse credentials (and the built client) another instance already refreshed
+            cache_key = _token_cache_key(creds)
+            if cache_key:
+                with _TOKEN_CACHE_LOCK:
+                    cached = _TOKEN_CACHE.get(cache_key)
+                if cached and not _token_expiring(cached[0]):
+                    self.credentials, self.service = cached
+                    logger.info("OAuth authentication reused cached credentials")
+                    return
+            
+            # Refresh a little ahead of expiry when possible; a token that cannot be refreshed
+            # is still used until it actually stops being valid
+            needs_refresh = bool(creds.refresh_token) and _token_expiring(creds)
+            if needs_refresh or not creds.valid:
+                if creds.refresh_token:
+                    logger.info("Refreshing expired token...")
                     creds.refresh(Request())
                 else:
-                    print("[AUTH] Starting OAuth flow...")
-                    credentials_info = json.loads(oauth_credentials)
+                    logger.info("Starting OAuth flow...")
+                    oauth_credentials = os.getenv('GOOGLE_OAUTH_CREDENTIALS')
+                    if not oauth_credentials:
+                        logger.error("Token expired and no OAuth credentials found to start a new flow")
+                        self.service = None
+                        return
+                    credentials_info = _json_loads(oauth_credentials)
                     
                     # Create web-based flow with explicit redirect URI
                     flow = Flow.from_client_config(
@@ -90,8 +229,8 @@ class SimpleOAuthGoogleDriveService:
                         include_granted_scopes='true',
                         prompt='consent'
                     )
-                    print(f"[OAUTH] Complete OAuth by visiting: {auth_url}")
-                    print("[OAUTH] After completing OAuth, restart the service")
+                    logger.info("Complete OAuth by visiting: %s", auth_url)
+                    logger.info("After completing OAuth, restart the service")
                     
                     # For now, we can't complete the flow automatically
                     self.service = None
@@ -101,114 +240,302 @@ class SimpleOAuthGoogleDriveService:
                 with open(token_file, 'w') as token:
                     token.write(creds.to_json())
             
-            self.service = build('drive', 'v3', credentials=creds)
-            print("[SUCCESS] OAuth authentication successful")
+            self.credentials = creds
+            # Build from the bundled discovery document: no HTTP fetch, no discovery cache lookup
+            # and no re-parse of the ~200 KB JSON on each build
+            self.service = build_from_document(_drive_discovery_doc(), credentials=creds)
+            if cache_key:
+                with _TOKEN_CACHE_LOCK:
+                    _TOKEN_CACHE[cache_key] = (self.credentials, self.service)
+            logger.info("OAuth authentication successful")
             
         except Exception as e:
-            print(f"[ERROR] OAuth authentication failed: {e}")
+            logger.error("OAuth authentication failed: %s", e)
             self.service = None
 
     def setup_folders(self):
         """Setup required folders in Google Drive"""
         if not self.service:
-            print("[WARNING] Google Drive service not available, skipping folder setup")
+            logger.warning("Google Drive service not available, skipping folder setup")
             return
         
         try:
-            self.folders["certificates"] = self.get_or_create_folder("certificates")
-            self.folders["templates"] = self.get_or_create_folder("templates")
-            self.folders["qr_codes"] = self.get_or_create_folder("qr_codes")
+            cached = _known_folder_ids()
+            missing = [folder_name for folder_name in self.folders if not cached.get(folder_name)]
+            if missing:
+                # One files.list for all unresolved folders instead of a lookup per folder
+                name_clause = " or ".join(f"name='{escape_drive_query(folder_name)}'" for folder_name in missing)
+                query = f"({name_clause}) and 'root' in parents and mimeType='application/vnd.google-apps.folder'"
+                results = _execute_with_backoff(self.service.files().list(
+                    q=query,
+                    fields="files(id, name)"
+                ), http=self._thread_http())
+                found = {}
+                for item in results.get('files', []):
+                    found.setdefault(item['name'], item['id'])
+                for folder_name in missing:
+                    folder_id = found.get(folder_name) or self._create_folder(folder_name)
+                    if folder_id:
+                        cached[folder_name] = folder_id
+            self.folders.update({folder_type: cached.get(folder_type) for folder_type in self.folders})
             
-            print("[SUCCESS] Google Drive folders setup complete:")
-            for folder_type, folder_id in self.folders.items():
-                print(f"   {folder_type.title()}: {folder_id}")
+            # A resolved ID says nothing about sharing; only skip the call for folders already shared
+            unshared = [folder_name for folder_name, folder_id in self.folders.items()
+                        if folder_id and folder_id not in _SHARED_FOLDER_IDS]
+            for folder_name in unshared:
+                self._share_folder(self.folders[folder_name])
+            self.public_folders = {
+                folder_name for folder_name, folder_id in self.folders.items()
+                if folder_id in _SHARED_FOLDER_IDS
+            }
+            if unshared and self.public_folders == set(self.folders):
+                _save_folder_cache()
+            
+            logger.info("Google Drive folders setup complete: %s", self.folders)
                 
         except Exception as e:
-            print(f"[ERROR] Error setting up Google Drive folders: {e}")
+            logger.error("Error setting up Google Drive folders: %s", e)
 
     def get_or_create_folder(self, folder_name: str) -> str:
-        """Get or create a folder in Google Drive"""
+        """Get or create a folder in Google Drive (IDs are cached per process; see _known_folder_ids)"""
+        cached_id = _known_folder_ids().get(folder_name)
+        if cached_id:
+            return cached_id
+        
         try:
             # Search for existing folder
-            query = f"name='{folder_name}' and 'root' in parents and mimeType='application/vnd.google-apps.folder'"
-            results = self.service.files().list(
+            query = f"name='{escape_drive_query(folder_name)}' and 'root' in parents and mimeType='application/vnd.google-apps.folder'"
+            results = _execute_with_backoff(self.service.files().list(
                 q=query, 
                 fields="files(id, name)"
-            ).execute()
+            ), http=self._thread_http())
             items = results.get('files', [])
             
-            if items:
-                return items[0]['id']
-            else:
-                # Create new folder
-                file_metadata = {
-                    'name': folder_name,
-                    'mimeType': 'application/vnd.google-apps.folder'
-                }
-                folder = self.service.files().create(
-                    body=file_metadata,
-                    fields='id'
-                ).execute()
-                return folder.get('id')
+            folder_id = items[0]['id'] if items else self._create_folder(folder_name)
+            if folder_id:
+                _FOLDER_IDS[folder_name] = folder_id
+            return folder_id
                 
         except Exception as e:
-            print(f"[ERROR] Error creating folder {folder_name}: {e}")
+            logger.error("Error creating folder %s: %s", folder_name, e)
+            return None
+
+    def _share_folder(self, folder_id: str) -> bool:
+        """Grant public read access on a folder (idempotent); returns whether it succeeded"""
+        try:
+            _execute_with_backoff(self.service.permissions().create(
+                fileId=folder_id,
+                body=PUBLIC_READER_PERMISSION,
+                fields='id'
+            ), http=self._thread_http())
+            _SHARED_FOLDER_IDS.add(folder_id)
+            return True
+        except Exception as e:
+            logger.warning("Could not share folder %s; files will be shared individually: %s", folder_id, e)
+            return False
+
+    def _create_folder(self, folder_name: str) -> Optional[str]:
+        """Create a folder in the Drive root"""
+        try:
+            file_metadata = {
+                'name': folder_name,
+                'mimeType': 'application/vnd.google-apps.folder'
+            }
+            folder = _execute_with_backoff(self.service.files().create(
+                body=file_metadata,
+                fields='id'
+            ), http=self._thread_http())
+            return folder.get('id')
+        except Exception as e:
+            logger.error("Error creating folder %s: %s", folder_name, e)
             return None
 
-    def upload_from_bytes(self, file_bytes: bytes, file_name: str, folder_type: str = "certificates") -> Optional[Dict[str, Any]]:
+    def _thread_http(self):
+        """Authorized keep-alive HTTP client owned by the calling thread, used for every Drive call"""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            base_http = build_http()
+            base_http.timeout = HTTP_TIMEOUT
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=base_http)
+            self._local.http = http
+        return http
+
+    def reset_connections(self):
+        """Drop every thread's HTTP client; credentials, the Drive client and folder IDs are kept"""
+        self._local = threading.local()
+
+    def _create_file(self, file_bytes: Union[bytes, BinaryIO], file_name: str, folder_id: str) -> Dict[str, Any]:
+        """Upload one file into a folder (no sharing); raises on API errors.
+        
+        Seekable file objects are streamed as-is; bytes are wrapped without copying.
+        """
+        file_metadata = {
+            'name': file_name,
+            'parents': [folder_id]
+        }
+        
+        stream = file_bytes if hasattr(file_bytes, "read") else io.BytesIO(file_bytes)
+        file_size = stream.seek(0, io.SEEK_END)
+        stream.seek(0)
+        
+        # Single multipart request for small files; resumable sessions cost an extra round-trip
+        media = MediaIoBaseUpload(
+            stream,
+            mimetype='image/png',
+            chunksize=RESUMABLE_CHUNK_SIZE,
+            resumable=file_size > RESUMABLE_UPLOAD_THRESHOLD
+        )
+        file = _execute_with_backoff(self.service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id, webViewLink, webContentLink'
+        ), http=self._thread_http())
+        
+        # Add image_url field for compatibility
+        file['image_url'] = file.get('webContentLink', file.get('webViewLink', ''))
+        return file
+
+    def _upload_to_folder(self, file_bytes: Union[bytes, BinaryIO], file_name: str, folder_type: str) -> Dict[str, Any]:
+        """Upload into a known folder, re-resolving the folder once if its cached ID has gone stale"""
+        try:
+            return self._create_file(file_bytes, file_name, self.folders[folder_type])
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            logger.warning("Folder %s (%s) not found, resolving it again", folder_type, self.folders[folder_type])
+            _SHARED_FOLDER_IDS.discard(_FOLDER_IDS.pop(folder_type, None))
+            folder_id = self.get_or_create_folder(folder_type)
+            if not folder_id:
+                raise
+            self.folders[folder_type] = folder_id
+            if self._share_folder(folder_id):
+                self.public_folders.add(folder_type)
+                _save_folder_cache()
+            else:
+                self.public_folders.discard(folder_type)
+            return self._create_file(file_bytes, file_name, folder_id)
+
+    def upload_from_bytes(self, file_bytes: Union[bytes, BinaryIO], file_name: str, folder_type: str = "certificates") -> Optional[Dict[str, Any]]:
         """Upload file from bytes to Google Drive"""
         if not self.service:
-            print("[ERROR] Google Drive service not available")
+            logger.error("Google Drive service not available")
             return None
         
         try:
             # Get folder ID
             folder_id = self.folders.get(folder_type)
             if not folder_id:
-                print(f"[ERROR] Folder not found for type: {folder_type}")
+                logger.error("Folder not found for type: %s", folder_type)
                 return None
             
-            # Upload file
-            file_metadata = {
-                'name': file_name,
-                'parents': [folder_id]
-            }
-            
-            media = MediaIoBaseUpload(io.BytesIO(file_bytes), mimetype='image/png')
-            file = self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id, webViewLink, webContentLink'
-            ).execute()
-            
-            # Make file publicly accessible
-            self.service.permissions().create(
-                fileId=file.get('id'),
-                body={'role': 'reader', 'type': 'anyone'}
-            ).execute()
+            file = self._upload_to_folder(file_bytes, file_name, folder_type)
             
-            # Add image_url field for compatibility
-            file['image_url'] = file.get('webContentLink', file.get('webViewLink', ''))
+            # Make file publicly accessible, unless it inherits that from its folder
+            if folder_type not in self.public_folders:
+                _execute_with_backoff(self.service.permissions().create(
+                    fileId=file.get('id'),
+                    body=PUBLIC_READER_PERMISSION
+                ), http=self._thread_http())
             
             return file
             
         except Exception as e:
-            print(f"[ERROR] Error uploading file {file_name}: {e}")
+            logger.error("Error uploading file %s: %s", file_name, e)
             return None
 
+    def upload_many(self, files: List[Tuple[Union[bytes, BinaryIO], str]], folder_type: str = "certificates") -> List[Optional[Dict[str, Any]]]:
+        """Upload several (file_bytes, file_name) pairs; returns one result (or None on failure) per input.
+        
+        Files in a publicly shared folder inherit access. Otherwise they are made public with batched
+        permission requests: media uploads cannot be batched, but the grants can (100 per round-trip).
+        """
+        if not self.service:
+            logger.error("Google Drive service not available")
+            return [None] * len(files)
+        
+        folder_id = self.folders.get(folder_type)
+        if not folder_id:
+            logger.error("Folder not found for type: %s", folder_type)
+            return [None] * len(files)
+        
+        results = []
+        for file_bytes, file_name in files:
+            try:
+                results.append(self._upload_to_folder(file_bytes, file_name, folder_type))
+            except Exception as e:
+                logger.error("Error uploading file %s: %s", file_name, e)
+                results.append(None)
+        
+        def on_permission(request_id, response, exception):
+            if exception is not None:
+                logger.warning("Could not set permissions for file %s: %s", request_id, exception)
+        
+        if folder_type in self.public_folders:
+            return results
+        
+        file_ids = [file['id'] for file in results if file and file.get('id')]
+        for start in range(0, len(file_ids), BATCH_MAX_CALLS):
+            batch = self.service.new_batch_http_request(callback=on_permission)
+            for file_id in file_ids[start:start + BATCH_MAX_CALLS]:
+                batch.add(
+                    self.service.permissions().create(fileId=file_id, body=PUBLIC_READER_PERMISSION, fields='id'),
+                    request_id=file_id
+                )
+            try:
+                batch.execute(http=self._thread_http())
+            except Exception as e:
+                logger.warning("Batched permission request failed: %s", e)
+        
+        return results
+
+    async def upload_from_bytes_async(self, file_bytes: Union[bytes, BinaryIO], file_name: str, folder_type: str = "certificates") -> Optional[Dict[str, Any]]:
+        """Upload file from bytes without blocking the event loop (runs the blocking client in a worker thread)"""
+        return await asyncio.to_thread(self.upload_from_bytes, file_bytes, file_name, folder_type)
+
+    async def upload_many_async(self, files: List[Tuple[Union[bytes, BinaryIO], str]], folder_type: str = "certificates", concurrency: int = UPLOAD_CONCURRENCY) -> List[Optional[Dict[str, Any]]]:
+        """Upload several (file_bytes, file_name) pairs concurrently; results keep the input order (None on failure)"""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def upload_one(file_bytes: Union[bytes, BinaryIO], file_name: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await self.upload_from_bytes_async(file_bytes, file_name, folder_type)
+        
+        results = await asyncio.gather(*(upload_one(file_bytes, file_name) for file_bytes, file_name in files), return_exceptions=True)
+        return [None if isinstance(result, BaseException) else result for result in results]
+
     def delete_file(self, file_id: str) -> bool:
         """Delete a file from Google Drive"""
         if not self.service:
-            print("[ERROR] Google Drive service not available")
+            logger.error("Google Drive service not available")
             return False
         
         try:
-            self.service.files().delete(fileId=file_id).execute()
+            _execute_with_backoff(self.service.files().delete(fileId=file_id), http=self._thread_http())
             return True
         except Exception as e:
-            print(f"[ERROR] Error deleting file {file_id}: {e}")
+            logger.error("Error deleting file %s: %s", file_id, e)
             return False
 
     def get_folder_id(self, folder_type: str) -> Optional[str]:
         """Get folder ID based on type"""
         return self.folders.get(folder_type)
+
+
+_drive_service: Optional[SimpleOAuthGoogleDriveService] = None
+_drive_service_lock = threading.Lock()
+
+def get_drive_service() -> SimpleOAuthGoogleDriveService:
+    """Shared SimpleOAuthGoogleDriveService, authenticated and set up once per process"""
+    global _drive_service
+    if _drive_service is None:
+        with _drive_service_lock:
+            if _drive_service is None:
+                _drive_service = SimpleOAuthGoogleDriveService()
+    return _drive_service
+
+# Opt-in: authenticate and resolve folders at import, so a server that preloads the app
+# (e.g. gunicorn preload_app) pays the setup cost once before forking its workers
+if os.getenv('DRIVE_PREWARM', '0') == '1':
+    # Keep the credentials, client and folder IDs, but not the open connection: a socket
+    # inherited across fork() must not be shared by several workers
+    get_drive_service().reset_connections()
@@ -1,15 +1,36 @@
+import base64
 import secrets
-import string
-from datetime import datetime
+from datetime import date
+from typing import Optional, Tuple
+
+# (day, "YYYYMMDD") for the last day an ID was generated; replaced as a whole tuple so
+# concurrent callers always see a matching pair
+_date_str_cache: Tuple[Optional[date], str] = (None, "")
+
+def _today_str() -> str:
+    """Today's date as YYYYMMDD, formatted once per day"""
+    global _date_str_cache
+    today = date.today()
+    cached_day, date_str = _date_str_cache
+    if cached_day != today:
+        date_str = today.strftime('%Y%m%d')
+        _date_str_cache = (today, date_str)
+    return date_str
+
+def _make_id(prefix: str) -> str:
+    """Build an ID in format PREFIX-YYYYMMDD-XXXXXX with a random base32 (A-Z, 2-7) suffix"""
+    # One CSPRNG read instead of six secrets.choice calls; 6 base32 chars carry 30 random bits
+    random_suffix = base64.b32encode(secrets.token_bytes(4))[:6].decode('ascii')
+    return f"{prefix}-{_today_str()}-{random_suffix}"
 
 def generate_certificate_id() -> str:
     """Generate a unique certificate ID in format TBS-YYYYMMDD-XXXXXX"""
-    date_str = datetime.now().strftime('%Y%m%d')
-    random_suffix = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(6))
-    return f"TBS-{date_str}-{random_suffix}"
+    return _make_id("TBS")
 
 def generate_template_id() -> str:
     """Generate a unique template ID in format TPL-YYYYMMDD-XXXXXX"""
-    date_str = datetime.now().strftime('%Y%m%d')
-    random_suffix = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(6))
-    return f"TPL-{date_str}-{random_suffix}"
+    return _make_id("TPL")
+
+def escape_drive_query(value: str) -> str:
+    """Escape a string literal for a Google Drive files.list query (backslashes and single quotes)"""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
@@ -5,40 +5,239 @@ Web-based OAuth flow for Google Drive
 
 import os
 import json
+import tempfile
+import asyncio
+import logging
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
+from typing import Optional, Dict, Any
+
+try:
+    # Optional faster parser for the client config (orjson's decode error subclasses ValueError)
+    from orjson import loads as _json_loads, dumps as _json_dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+logger = logging.getLogger(__name__)
+
+def _parse_credentials() -> Optional[Dict[str, Any]]:
+    """Parse GOOGLE_OAUTH_CREDENTIALS (None if unset or not valid JSON)"""
+    oauth_credentials = os.getenv('GOOGLE_OAUTH_CREDENTIALS')
+    if not oauth_credentials:
+        return None
+    try:
+        return _json_loads(oauth_credentials)
+    except ValueError as e:
+        logger.error("GOOGLE_OAUTH_CREDENTIALS is not valid JSON: %s", e)
+        return None
+
+# OAuth scopes; a tuple so it can key the _get_flow cache directly
+SCOPES = ('https://www.googleapis.com/auth/drive',)
+
+# Extra sanity checks in create_web_oauth_flow(); always on when run as a script
+OAUTH_DEBUG = bool(os.getenv('OAUTH_DEBUG'))
+
+_WEB_REQUIRED_FIELDS = ('client_id', 'client_secret', 'auth_uri', 'token_uri')
+
+def _validate_credentials(info: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Return why the client config cannot drive a web flow, or None if it can"""
+    if not info:
+        return "GOOGLE_OAUTH_CREDENTIALS environment variable not set"
+    web = info.get('web') if isinstance(info, dict) else None
+    if not isinstance(web, dict):
+        return ("Web credentials not found in GOOGLE_OAUTH_CREDENTIALS; "
+                "make sure your credentials have a 'web' section with redirect_uris")
+    missing = [field for field in _WEB_REQUIRED_FIELDS if not web.get(field)]
+    if missing:
+        return f"Web credentials in GOOGLE_OAUTH_CREDENTIALS are missing: {', '.join(missing)}"
+    return None
+
+# One keep-alive pool to oauth2.googleapis.com shared by token exchanges and refreshes
+_HTTPS_ADAPTER = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=10,
+    max_retries=Retry(total=2, backoff_factor=0.2),
+)
+_SESSION = requests.Session()
+_SESSION.mount('https://', _HTTPS_ADAPTER)
+_AUTH_REQUEST = Request(session=_SESSION)
+
+# Credentials from completed exchanges, keyed by sha256(user_id); reused until near expiry
+_TOKEN_CACHE: Dict[str, Credentials] = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+TOKEN_REFRESH_MARGIN = 60  # seconds before expiry at which a token is refreshed
+BACKGROUND_REFRESH_MARGIN = 300  # background thread refreshes tokens this close to expiry
+BACKGROUND_REFRESH_INTERVAL = 60
+_refresh_thread: Optional[threading.Thread] = None
+
+# Refresh tokens survive restarts here (owner-only), so users are not sent through consent again
+_TOKEN_FILE_LOCK = threading.Lock()  # serialises snapshot + write so saves cannot interleave
+TOKEN_PATH = os.getenv('GOOGLE_OAUTH_TOKEN_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.oauth_tokens.json'))
+
+def _token_cache_key(user_id: str) -> str:
+    return hashlib.sha256(user_id.encode('utf-8')).hexdigest()
+
+def _seconds_to_expiry(creds: Credentials) -> float:
+    if creds.expiry is None:
+        return float('inf')
+    # google-auth keeps expiry as a naive UTC datetime
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return (creds.expiry - now).total_seconds()
+
+def _refresh_loop():
+    """Refresh cached tokens ahead of expiry so requests rarely pay for a refresh"""
+    while True:
+        time.sleep(BACKGROUND_REFRESH_INTERVAL)
+        with _TOKEN_CACHE_LOCK:
+            entries = list(_TOKEN_CACHE.items())
+        for key, creds in entries:
+            if not creds.refresh_token or _seconds_to_expiry(creds) >= BACKGROUND_REFRESH_MARGIN:
+                continue
+            try:
+                creds.refresh(_AUTH_REQUEST)
+            except Exception as e:
+                # get_credentials() still refreshes inline if this keeps failing
+                logger.warning("Background token refresh failed: %s", e)
+
+def _ensure_refresh_thread():
+    global _refresh_thread
+    with _TOKEN_CACHE_LOCK:
+        if _refresh_thread is None:
+            _refresh_thread = threading.Thread(target=_refresh_loop, name="oauth-token-refresh", daemon=True)
+            _refresh_thread.start()
+
+def _credentials_info(creds: Credentials) -> Dict[str, Any]:
+    """Fields Credentials.from_authorized_user_info() needs to rebuild the credentials"""
+    return {
+        'token': creds.token,
+        'refresh_token': creds.refresh_token,
+        'token_uri': creds.token_uri,
+        'client_id': creds.client_id,
+        'client_secret': creds.client_secret,
+        'scopes': creds.scopes,
+        'expiry': creds.expiry.isoformat() if creds.expiry else None,
+    }
+
+def _save_persisted_tokens():
+    """Write every cached credential with a refresh token to TOKEN_PATH with mode 0o600"""
+    with _TOKEN_FILE_LOCK:
+        # Snapshot under the file lock so the newest save is also the last one written
+        with _TOKEN_CACHE_LOCK:
+            data = {key: _credentials_info(creds) for key, creds in _TOKEN_CACHE.items() if creds.refresh_token}
+        tmp_path = None
+        try:
+            # mkstemp creates the file with mode 0o600
+            fd, tmp_path = tempfile.mkstemp(prefix='.oauth_tokens.', dir=os.path.dirname(os.path.abspath(TOKEN_PATH)))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_json_dumps(data))
+            os.replace(tmp_path, TOKEN_PATH)
+        except OSError as e:
+            logger.warning("Could not persist OAuth tokens to %s: %s", TOKEN_PATH, e)
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+def _load_persisted_tokens():
+    """Seed _TOKEN_CACHE from TOKEN_PATH; expired tokens are refreshed on first use"""
+    try:
+        with open(TOKEN_PATH, 'rb') as f:
+            data = _json_loads(f.read())
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable OAuth token file %s: %s", TOKEN_PATH, e)
+        return
+    for key, info in data.items():
+        try:
+            creds = Credentials.from_authorized_user_info(info, info.get('scopes'))
+        except ValueError as e:
+            logger.warning("Skipping invalid persisted OAuth token: %s", e)
+            continue
+        with _TOKEN_CACHE_LOCK:
+            _TOKEN_CACHE[key] = creds
+
+def cache_credentials(user_id: str, creds: Credentials):
+    """Store credentials obtained for a user so later calls can reuse the access token"""
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[_token_cache_key(user_id)] = creds
+    if creds.refresh_token:
+        _save_persisted_tokens()
+    _ensure_refresh_thread()
+
+def get_credentials(user_id: str) -> Optional[Credentials]:
+    """Return cached credentials for a user, refreshing them if they expire within a minute"""
+    key = _token_cache_key(user_id)
+    with _TOKEN_CACHE_LOCK:
+        creds = _TOKEN_CACHE.get(key)
+    if creds is None:
+        return None
+    if not creds.valid or _seconds_to_expiry(creds) <= TOKEN_REFRESH_MARGIN:
+        creds.refresh(_AUTH_REQUEST)
+        with _TOKEN_CACHE_LOCK:
+            _TOKEN_CACHE[key] = creds
+    return creds
+
+# Import-time initialisation
+# The client config is fixed for the life of the process, so it is parsed and validated once;
+# a bad config is reported at startup instead of at first login
+_CREDS_INFO = _parse_credentials()
+_CREDS_ERROR = _validate_credentials(_CREDS_INFO)
+if _CREDS_INFO is not None and _CREDS_ERROR:
+    logger.error(_CREDS_ERROR)
+_load_persisted_tokens()
+
+def reload_credentials():
+    """Re-read GOOGLE_OAUTH_CREDENTIALS, e.g. after the environment has been updated"""
+    global _CREDS_INFO, _CREDS_ERROR
+    _CREDS_INFO = _parse_credentials()
+    _CREDS_ERROR = _validate_credentials(_CREDS_INFO)
+    _get_flow.cache_clear()
+
+def _build_flow(redirect_uri: str, scopes: tuple) -> Flow:
+    flow = Flow.from_client_config(_CREDS_INFO, scopes=list(scopes), redirect_uri=redirect_uri)
+    # fetch_token() goes through the flow's OAuth2Session; give it the shared pool
+    flow.oauth2session.mount('https://', _HTTPS_ADAPTER)
+    return flow
+
+@lru_cache(maxsize=4)
+def _get_flow(redirect_uri: str, scopes: tuple) -> Flow:
+    """Build the Flow once per (redirect_uri, scopes); authorization_url() makes a fresh state each call"""
+    return _build_flow(redirect_uri, scopes)
+
+def fetch_credentials(code: str, user_id: str, redirect_uri: str = 'http://localhost:8080',
+                      scopes: tuple = SCOPES) -> Credentials:
+    """Exchange an authorization code for credentials, then cache and persist them for user_id"""
+    # A fresh Flow per exchange: fetch_token() stores the token on the flow's session
+    flow = _build_flow(redirect_uri, scopes)
+    flow.fetch_token(code=code)
+    creds = flow.credentials
+    cache_credentials(user_id, creds)
+    return creds
 
 def create_web_oauth_flow():
     """Create a web-based OAuth flow with proper redirect URI"""
     
-    print("Creating Web OAuth Flow")
-    print("=" * 30)
-    
-    # OAuth scopes
-    SCOPES = ['https://www.googleapis.com/auth/drive']
+    logger.debug("Creating Web OAuth Flow")
     
-    # Get credentials from environment variable
-    oauth_credentials = os.getenv('GOOGLE_OAUTH_CREDENTIALS')
-    if not oauth_credentials:
-        print("ERROR: GOOGLE_OAUTH_CREDENTIALS environment variable not set")
+    # Credentials parsed and validated from the environment at import
+    if _CREDS_ERROR:
+        logger.error(_CREDS_ERROR)
         return None
     
     try:
-        credentials_info = json.loads(oauth_credentials)
-        
-        # Ensure we have web credentials
-        if 'web' not in credentials_info:
-            print("ERROR: Web credentials not found in GOOGLE_OAUTH_CREDENTIALS")
-            print("Make sure your credentials have 'web' section with redirect_uris")
-            return None
-        
         # Create flow with explicit redirect URI
-        flow = Flow.from_client_config(
-            credentials_info, 
-            scopes=SCOPES,
-            redirect_uri='http://localhost:8080'  # Explicit redirect URI
-        )
+        flow = _get_flow('http://localhost:8080', SCOPES)  # Explicit redirect URI
         
         # Generate OAuth URL
         auth_url, state = flow.authorization_url(
@@ -47,21 +246,27 @@ def create_web_oauth_flow():
             prompt='consent'
         )
         
-        print("SUCCESS: Web OAuth URL generated")
-        print(f"Redirect URI: http://localhost:8080")
-        print(f"OAuth URL: {auth_url}")
+        logger.debug("Web OAuth URL generated (redirect URI http://localhost:8080): %s", auth_url)
         
         # Check if redirect_uri is in the URL
-        if 'redirect_uri=' in auth_url:
-            print("✓ redirect_uri parameter found in URL")
-        else:
-            print("❌ redirect_uri parameter MISSING from URL")
+        if OAUTH_DEBUG and 'redirect_uri=' not in auth_url:
+            logger.warning("redirect_uri parameter MISSING from OAuth URL")
         
         return auth_url
         
     except Exception as e:
-        print(f"ERROR: Failed to create web OAuth flow: {e}")
+        logger.error("Failed to create web OAuth flow: %s", e)
         return None
 
+async def create_web_oauth_flow_async():
+    """create_web_oauth_flow() off the event loop, for async callers"""
+    return await asyncio.to_thread(create_web_oauth_flow)
+
+async def exchange_code(code: str, user_id: str, redirect_uri: str = 'http://localhost:8080') -> Credentials:
+    """Async fetch_credentials(): the blocking token exchange runs in a worker thread"""
+    return await asyncio.to_thread(fetch_credentials, code, user_id, redirect_uri)
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, format="%(levelname)s: %(message)s")
+    OAUTH_DEBUG = True
     create_web_oauth_flow()